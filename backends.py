@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import os
+
+import groq
+import httpx
+
+# The openai SDK (and langchain-openai) are only needed for "openai" backends
+try:
+    import openai
+except ImportError:
+    openai = None
+
+logger = logging.getLogger(__name__)
+
+# --- Providers ---
+# Every backend is a LangChain chat model, so the conversation pipeline talks to
+# all of them the same way. "groq" is the Groq API; "openai" is anything that speaks
+# the OpenAI chat-completions protocol: OpenAI itself, vLLM, or a local CPU model
+# served by llama.cpp's server or Ollama (both expose it under /v1).
+
+PROVIDERS = ("groq", "openai")
+GROQ_BASE_URL = "https://api.groq.com"
+
+# Status and connection errors look alike across the two SDKs
+API_STATUS_ERRORS = (groq.APIStatusError,) + ((openai.APIStatusError,) if openai else ())
+API_CONNECTION_ERRORS = (groq.APIConnectionError,) + ((openai.APIConnectionError,) if openai else ())
+
+
+def create_chat_model(provider, model, api_key, base_url=None, temperature=0.7, http_client=None,
+                      http_async_client=None):
+    """Builds the chat model client for one provider. Retries are left to the caller (max_retries=0)."""
+    if provider == "groq":
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            temperature=temperature,
+            groq_api_key=api_key,
+            model_name=model,
+            groq_api_base=base_url,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0,
+        )
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI # Optional dependency; raises ImportError if missing
+        return ChatOpenAI(
+            temperature=temperature,
+            api_key=api_key,
+            model=model,
+            base_url=base_url,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            max_retries=0,
+            stream_usage=True, # Token counts on the last streamed chunk, as Groq sends them
+        )
+    raise ValueError(f"Unknown provider {provider!r}; expected one of {PROVIDERS}")
+
+
+# --- Backend Configuration ---
+
+class Backend:
+    """One entry in the failover order: a provider, a model on it and how to reach it."""
+
+    def __init__(self, name, provider, model, base_url=None, api_keys=()):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.base_url = base_url # None means the provider's default endpoint
+        self.api_keys = list(api_keys)
+
+    @property
+    def models_url(self):
+        """The model-list endpoint, used as a cheap health check."""
+        if self.provider == "groq":
+            return (self.base_url or GROQ_BASE_URL).rstrip("/") + "/openai/v1/models"
+        return (self.base_url or "https://api.openai.com/v1").rstrip("/") + "/models"
+
+    def __repr__(self):
+        return f"Backend({self.name!r}, {self.provider!r}, {self.model!r})"
+
+
+def load_backends(specs, groq_api_keys, default_model):
+    """Resolves the BACKENDS config into Backend objects, skipping entries that can't be used.
+
+    "groq" entries use the Groq key pool and default to default_model; others read
+    their key from api_key_env (or take a literal api_key, e.g. for a local server).
+    base_url_env, if set in the environment, overrides base_url; an entry with a
+    base_url_env that isn't set and no base_url is skipped (an opt-in endpoint).
+    """
+    backends = []
+    for spec in specs:
+        provider = spec.get("provider", "groq")
+        base_url = os.getenv(spec["base_url_env"]) if spec.get("base_url_env") else None
+        base_url = base_url or spec.get("base_url")
+        if spec.get("base_url_env") and not base_url:
+            logger.info("Backend %r skipped: %s is not set", spec.get("name"), spec["base_url_env"])
+            continue
+        if provider == "groq":
+            api_keys = list(groq_api_keys)
+            base_url = base_url or os.getenv("GROQ_API_BASE")
+        else:
+            api_key = os.getenv(spec["api_key_env"]) if spec.get("api_key_env") else None
+            api_keys = [api_key or spec.get("api_key")] if api_key or spec.get("api_key") else []
+        if not api_keys:
+            logger.warning("Backend %r skipped: no API key configured", spec.get("name"))
+            continue
+        backends.append(Backend(
+            spec.get("name", provider), provider, spec.get("model", default_model), base_url, api_keys,
+        ))
+    return backends
+
+
+# --- Health Checks ---
+
+class HealthCheck:
+    """Polls a backend's model-list endpoint in the background; `healthy` holds the verdict.
+
+    Any response below 500 counts as a passed check (the endpoint is up, even if the
+    key is rejected); errors and timeouts fail it. The backend is only marked
+    unhealthy after `failures` checks in a row fail, so one network blip doesn't
+    take it out of rotation; the first passed check marks it healthy again.
+    """
+
+    def __init__(self, url, api_key, interval=30.0, timeout=5.0, failures=3, on_change=None):
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.interval = interval
+        self.timeout = timeout
+        self.failures = failures # Consecutive failed checks before the backend counts as unhealthy
+        self.on_change = on_change # on_change(healthy)
+        self.healthy = True # Until enough checks say otherwise
+        self._failed = 0 # Consecutive failed checks so far
+
+    def start(self, loop):
+        """Starts checking on the given (running) event loop."""
+        asyncio.run_coroutine_threadsafe(self._run(), loop)
+        return self
+
+    async def _run(self):
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            while True:
+                try:
+                    response = await client.get(self.url, headers=self.headers)
+                    passed = response.status_code < 500
+                except httpx.HTTPError:
+                    passed = False
+                self._failed = 0 if passed else self._failed + 1
+                healthy = self._failed < self.failures
+                if healthy != self.healthy:
+                    self.healthy = healthy
+                    if self.on_change:
+                        self.on_change(healthy)
+                await asyncio.sleep(self.interval)
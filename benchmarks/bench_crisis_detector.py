@@ -0,0 +1,114 @@
+"""Benchmarks the local crisis-language detector at high message rates.
+
+Runs a mixed stream of messages (mostly everyday ones, some with crisis
+language, misspellings and leetspeak) through safety.detect_crisis and reports
+per-message latency and single-thread throughput by message length. For
+comparison it also times the naive approach of one regex search per phrase over
+the same normalized text. Also checks what the detector catches and ignores.
+
+Run from the repository root:
+
+    python benchmarks/bench_crisis_detector.py
+"""
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from safety import CRISIS_PHRASES, CrisisDetector, _expand, detect_crisis
+
+MESSAGES = 50000
+CRISIS_SHARE = 0.05 # Share of messages containing crisis language
+
+EVERYDAY = (
+    "I've been feeling anxious about work lately",
+    "Today was actually pretty good, I went for a walk",
+    "I can't sleep and my mind keeps racing about everything I need to do tomorrow",
+    "My sister and I had an argument and I don't know how to fix it",
+    "thanks, that helps",
+    "I'm proud of myself for getting out of bed today",
+    "I killed it at my presentation but I still feel like a fraud",
+    "The prices shot up again and money is tight",
+)
+CRISIS = (
+    "I want to kill myself",
+    "honestly i wanna k1ll my self",
+    "im so suicidal tonight",
+    "I keep thinking about sucide",
+    "everyone would be better off without me",
+    "I've been cutting myselfff again",
+    "sometimes I want to hurt someone",
+)
+# (text, expected categories) for the correctness check
+CASES = [(text, ["self_harm"]) for text in CRISIS[:-1]] + [(CRISIS[-1], ["harm_to_others"])]
+CASES += [(text, []) for text in EVERYDAY]
+CASES += [(text, []) for text in ("I ran 5 kms today", "my 2 kms walk", "harmonica myself", "self harmony")]
+
+
+def make_messages(words):
+    """MESSAGES messages of about `words` words, CRISIS_SHARE of them with crisis language."""
+    rng = random.Random(0)
+    messages = []
+    for _ in range(MESSAGES):
+        parts = []
+        while sum(len(part.split()) for part in parts) < words:
+            parts.append(rng.choice(EVERYDAY))
+        if rng.random() < CRISIS_SHARE:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(CRISIS))
+        messages.append(". ".join(parts))
+    return messages
+
+
+def naive_detector():
+    """One compiled regex per phrase variant, searched one after another over the same normalized words."""
+    detector = CrisisDetector(CRISIS_PHRASES) # Only used for its normalization
+    patterns = []
+    for category, phrases in CRISIS_PHRASES.items():
+        for phrase in phrases:
+            for variant in _expand(phrase):
+                words = " ".join(detector.normalize(variant.rstrip("*")))
+                ending = "[a-z]*" if variant.endswith("*") else ""
+                patterns.append((category, re.compile(r"\b" + re.escape(words) + ending + r"\b")))
+
+    def detect(text):
+        text = " ".join(detector.normalize(text))
+        return list(dict.fromkeys(category for category, pattern in patterns if pattern.search(text)))
+    return detect
+
+
+def run(detect, messages):
+    """Returns per-message times in microseconds and the messages flagged."""
+    samples, flagged = [], 0
+    for text in messages:
+        start = time.perf_counter()
+        if detect(text):
+            flagged += 1
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples, flagged
+
+
+def report(name, samples, flagged):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    rate = len(samples) / (sum(samples) / 1e6)
+    print(f"{name:<28} p50 {p50:7.1f} us   p99 {p99:7.1f} us   {rate:10,.0f} msg/s   {flagged} flagged")
+
+
+if __name__ == "__main__":
+    misses = [(text, detect_crisis(text), expected) for text, expected in CASES if detect_crisis(text) != expected]
+    print(f"correctness: {len(CASES) - len(misses)}/{len(CASES)} cases as expected")
+    for text, got, expected in misses:
+        print(f"  {text!r}: got {got}, expected {expected}")
+
+    naive = naive_detector()
+    for words in (10, 50, 200):
+        messages = make_messages(words)
+        run(detect_crisis, messages[:1000]) # Warm up
+        print(f"\n~{words} words per message ({statistics.mean(map(len, messages)):.0f} chars)")
+        report("automaton (detect_crisis)", *run(detect_crisis, messages))
+        report("regex per phrase", *run(naive, messages))
@@ -0,0 +1,92 @@
+"""Measures per-session memory used by the chat history.
+
+Compares the old layout, where every message lived twice (a dict in
+st.session_state.messages and a HumanMessage/AIMessage in
+ConversationBufferMemory), with plain dicts alone and with the single
+MessageStore of slotted Message records the UI and the prompt builder now
+share. Message text is generated fresh per message, as it would be in real
+sessions, and is included in every figure. At 10 turns the dict figures read
+low because CPython hands out dicts from its free list, which tracemalloc
+doesn't see.
+
+Run from the repository root:
+
+    python benchmarks/bench_history_memory.py
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.memory import ConversationBufferMemory
+
+from history import MessageStore
+
+TURN_COUNTS = (10, 100, 1000)
+
+
+def user_text(i):
+    return f"Today was hard again, I keep worrying about work and sleep ({i})."
+
+
+def assistant_text(i):
+    return f"That sounds exhausting. It makes sense to feel worn down - what has helped a little so far? ({i})"
+
+
+def old_session(turns):
+    messages = []
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    for i in range(turns):
+        user, reply = user_text(i), assistant_text(i)
+        messages.append({"role": "user", "content": user})
+        messages.append({"role": "assistant", "content": reply})
+        memory.save_context({"input": user}, {"response": reply})
+    return messages, memory
+
+
+def dict_session(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": user_text(i)})
+        messages.append({"role": "assistant", "content": assistant_text(i)})
+    return messages
+
+
+def store_session(turns, timestamps=False):
+    store = MessageStore(timestamps=timestamps)
+    for i in range(turns):
+        store.append("user", user_text(i))
+        store.append("assistant", assistant_text(i))
+    return store
+
+
+def measure(build, turns):
+    """Returns the bytes still allocated by the session after it is built."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    session = build(turns)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del session
+    return after - before
+
+
+LAYOUTS = {
+    "dict + LangChain memory": old_session,
+    "dicts only": dict_session,
+    "MessageStore": store_session,
+    "MessageStore + timestamps": lambda turns: store_session(turns, timestamps=True),
+}
+
+
+if __name__ == "__main__":
+    # Build once untraced so import-time and first-use caches don't count
+    for build in LAYOUTS.values():
+        build(1)
+
+    print("bytes per message (2 messages per turn)")
+    print(f"{'layout':<27}" + "".join(f"{f'{turns} turns':>13}" for turns in TURN_COUNTS))
+    for name, build in LAYOUTS.items():
+        row = [measure(build, turns) / (2 * turns) for turns in TURN_COUNTS]
+        print(f"{name:<27}" + "".join(f"{size:>13,.0f}" for size in row))
@@ -0,0 +1,53 @@
+"""Measures the chat payload sent to the browser on each full rerun.
+
+Runs main.py against sessions of growing length and sums the serialized size of
+every chat message element in the page, with history paging on (the default
+HISTORY_PAGE_SIZE) and off (every message rendered, as before). Nothing is sent
+to Groq.
+
+Run from the repository root:
+
+    python benchmarks/bench_payload.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "benchmark-key")
+
+from streamlit.testing.v1 import AppTest
+
+import config
+from history import MessageStore
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+HISTORY_SIZES = (50, 200, 1000, 5000)
+
+
+def session(size):
+    store = MessageStore()
+    for i in range(size // 2):
+        store.append("user", f"Some days are harder than others, today was one of them ({i}).")
+        store.append("assistant", f"I'm sorry today was so hard. Would you like to talk about what happened? ({i})")
+    return store
+
+
+def payload(size, page_size):
+    """Returns (messages rendered, bytes of chat elements) for one full rerun."""
+    config.HISTORY_PAGE_SIZE = page_size # main.py reads it from config on every run
+    app = AppTest.from_file(MAIN_SCRIPT, default_timeout=60)
+    app.session_state["messages"] = session(size)
+    app.run()
+    size_bytes = sum(element.proto.ByteSize() for element in app.markdown)
+    size_bytes += sum(block.proto.ByteSize() for block in app.chat_message)
+    return len(app.chat_message), size_bytes
+
+
+if __name__ == "__main__":
+    page_size = config.HISTORY_PAGE_SIZE
+
+    print(f"{'messages':>9} {'unpaged':>22} {f'paged ({page_size}/page)':>22}")
+    for size in HISTORY_SIZES:
+        full_count, full_bytes = payload(size, 10**9)
+        paged_count, paged_bytes = payload(size, page_size)
+        print(f"{size:>9} {full_count:>6} msgs {full_bytes:>9,} B {paged_count:>6} msgs {paged_bytes:>9,} B")
@@ -0,0 +1,105 @@
+"""Micro-benchmarks per-turn framework overhead: ConversationChain vs. Conversation.
+
+Both paths run against a local fake chat model that answers instantly, so the
+numbers are pure LangChain/bookkeeping overhead with no network involved. The
+memory is cleared every HISTORY_TURNS turns so both see the same history sizes.
+
+Conversation can come out slower per turn, and that is the price of the turn
+deadline: to be cancellable, the model is called with ainvoke() on the
+shared event loop thread rather than with a blocking invoke() on the script
+thread. LangChain's async call path costs more than its sync one, and handing
+the call to the loop thread (and the result back) adds a thread wake-up. The
+benchmark measures that cost on its own and reports the rest of the difference,
+prompt building and bookkeeping, separately. Against a real provider it is small
+next to the network round trip, and it lets a stuck request be cancelled instead
+of pinning a script thread.
+
+Run from the repository root:
+
+    python benchmarks/bench_pipeline.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.chains import ConversationChain
+from langchain.memory import ConversationBufferMemory
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from chatbot import Conversation, prompt_template
+from history import MessageStore
+from memory import TokenWindowMemory
+from resilience import run_with_deadline
+
+TURNS = 2000
+HISTORY_TURNS = 10
+REPLY = "That sounds really hard. I'm here to listen - would you like to tell me more?"
+
+
+class InstantChatModel(FakeListChatModel):
+    """FakeListChatModel answers async calls on a thread pool; ChatGroq's are natively async."""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._generate(messages, stop=stop, **kwargs)
+
+
+def new_memory():
+    return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+
+
+def run(turn):
+    """Runs TURNS turns and returns the per-turn times in microseconds."""
+    samples = []
+    for i in range(TURNS):
+        start = time.perf_counter()
+        turn(f"I've been feeling anxious about work lately ({i})")
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<20} p50 {p50:8.1f} us   p99 {p99:8.1f} us")
+    return p50
+
+
+if __name__ == "__main__":
+    llm = InstantChatModel(responses=[REPLY])
+
+    chain = ConversationChain(llm=llm, memory=new_memory(), prompt=prompt_template, verbose=False)
+    def old_turn(text):
+        if len(chain.memory.chat_memory.messages) >= 2 * HISTORY_TURNS:
+            chain.memory.clear()
+        return chain.invoke({"input": text})["response"]
+
+    store = MessageStore()
+    conversation = Conversation(llm, store, TokenWindowMemory(store, max_token_limit=10**9))
+    def new_turn(text):
+        if len(store) >= 2 * HISTORY_TURNS:
+            store.clear()
+            conversation.memory.clear()
+        store.append("user", text)
+        return conversation.invoke()
+
+    # Warm up both paths before measuring
+    run(old_turn), run(new_turn)
+
+    # The model call alone, blocking vs. cancellable on the shared loop (see above)
+    messages = conversation.build_messages()
+    def blocking_call(text):
+        return llm.invoke(messages)
+    def loop_call(text):
+        return run_with_deadline(lambda: llm.ainvoke(messages), 45)
+    run(blocking_call), run(loop_call)
+
+    old_p50 = report("ConversationChain", run(old_turn))
+    new_p50 = report("Conversation", run(new_turn))
+    deadline_cost = report("  call, loop", run(loop_call)) - report("  call, blocking", run(blocking_call))
+    print(f"cost of the cancellable call on the event loop: {deadline_cost:.1f} us per turn")
+    print(f"overhead saved per turn, apart from that: {old_p50 - (new_p50 - deadline_cost):.1f} us")
+    print(f"overhead saved per turn, overall: {old_p50 - new_p50:.1f} us ({old_p50 / new_p50:.2f}x)")
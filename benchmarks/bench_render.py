@@ -0,0 +1,75 @@
+"""Benchmarks per-turn UI cost of main.py as the conversation grows.
+
+Drives the real app with AppTest: each turn types a message into main.py's
+chat_area fragment, which streams the reply into the page. The session's
+conversation is set up beforehand over a local model that answers instantly
+(as in bench_pipeline.py), so neither the network nor the rate limiters are
+timed. Two setups are compared on the same stored history:
+
+* every message drawn: visible_messages covers the whole history, as every
+  turn did before history paging and the fragment;
+* as shipped: the history is paged (HISTORY_PAGE_SIZE) and the fragment
+  redraws only what was added since the last full run.
+
+AppTest reruns the whole script on every interaction (it can't rerun a
+fragment alone), so the shipped figure also includes redrawing the visible
+page. In the browser, a turn only reruns chat_area, so it costs even less.
+
+Run from the repository root:
+
+    python benchmarks/bench_render.py
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.testing.v1 import AppTest
+
+from bench_pipeline import REPLY, InstantChatModel
+from chatbot import Conversation
+from history import MessageStore
+from memory import TokenWindowMemory
+
+HISTORY_SIZES = (500, 1000, 2000)
+TURNS = 8 # Turns timed per setup
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def make_history(size):
+    store = MessageStore()
+    for i in range(size // 2):
+        store.append("user", f"Some days are harder than others, today was one of them ({i}).")
+        store.append("assistant", f"I'm sorry today was so hard. Would you like to talk about what happened? ({i})")
+    return store
+
+
+def turn_ms(history_size, draw_everything):
+    """Median wall time of one chat turn through main.py with history_size stored messages."""
+    store = make_history(history_size)
+    app = AppTest.from_file(MAIN_SCRIPT, default_timeout=60)
+    app.session_state["messages"] = store
+    app.session_state["conversation_chain"] = Conversation(InstantChatModel(responses=[REPLY]), store, TokenWindowMemory(store))
+    if draw_everything:
+        app.session_state["visible_messages"] = history_size + 2 * TURNS
+    app.run()
+    app.chat_input[0].set_value("Warming up").run()
+
+    samples = []
+    for i in range(TURNS):
+        start = time.perf_counter()
+        app.chat_input[0].set_value(f"I've been feeling anxious about work lately ({i})").run()
+        samples.append((time.perf_counter() - start) * 1000)
+        assert not app.exception, app.exception
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("GROQ_API_KEY", "benchmark-key") # main.py checks for a key; nothing is sent
+
+    print(f"{'messages':>9} {'every message drawn':>21} {'as shipped':>14}")
+    for size in HISTORY_SIZES:
+        print(f"{size:>9} {turn_ms(size, True):>18.1f} ms {turn_ms(size, False):>11.1f} ms")
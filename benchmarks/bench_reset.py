@@ -0,0 +1,83 @@
+"""Benchmarks "Clear Chat History": rebuilding the chain vs. resetting memory in place.
+
+The old handler rebuilt ChatGroq, memory and ConversationChain and then forced an
+extra st.rerun(). The new one clears the memory in place within the same run.
+
+Run from the repository root. No chat requests are sent to Groq, but building the
+chain starts the backend health checks, which poll Groq's model list in the
+background (see config.BACKEND_HEALTH_CHECK_SECONDS):
+
+    python benchmarks/bench_reset.py
+"""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GROQ_API_KEY", "benchmark-key") # Clients are built but never called
+
+from langchain.chains import ConversationChain
+from langchain.memory import ConversationBufferMemory
+from langchain_groq import ChatGroq
+from streamlit.testing.v1 import AppTest
+
+from chatbot import DEFAULT_MODEL, initialize_chain, prompt_template, reset_conversation
+from history import MessageStore
+
+REPEATS = 200
+TURNS = 20 # Conversation length before each clear
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def rebuild_chain():
+    """What the old Clear Chat History handler did: build everything from scratch."""
+    llm = ChatGroq(temperature=0.7, groq_api_key=os.environ["GROQ_API_KEY"], model_name=DEFAULT_MODEL)
+    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    return ConversationChain(llm=llm, memory=memory, prompt=prompt_template, verbose=False)
+
+
+def fill(chain):
+    for i in range(TURNS):
+        chain.store.append("user", f"user message {i}")
+        chain.save_reply(f"assistant reply {i}")
+
+
+def rebuild_ms():
+    return min(timeit.repeat(rebuild_chain, repeat=5, number=REPEATS)) / REPEATS * 1000
+
+
+def reset_ms(chain):
+    elapsed = 0.0
+    for _ in range(REPEATS):
+        fill(chain) # Not timed: only the clear itself counts
+        start = time.perf_counter()
+        reset_conversation(chain)
+        elapsed += time.perf_counter() - start
+    return elapsed / REPEATS * 1000
+
+
+def script_run_ms():
+    """Cost of one full Streamlit script run, i.e. what st.rerun() adds."""
+    app = AppTest.from_file(MAIN_SCRIPT, default_timeout=30).run()
+    start = time.perf_counter()
+    for _ in range(20):
+        app.run()
+    return (time.perf_counter() - start) / 20 * 1000
+
+
+if __name__ == "__main__":
+    chain = initialize_chain(os.environ["GROQ_API_KEY"], MessageStore())
+
+    rebuild = rebuild_ms()
+    reset = reset_ms(chain)
+    rerun = script_run_ms()
+
+    old_total = rebuild + 2 * rerun # Button run + forced st.rerun()
+    new_total = reset + rerun
+
+    print(f"rebuild chain:        {rebuild:8.3f} ms")
+    print(f"reset memory:         {reset:8.3f} ms")
+    print(f"one script run:       {rerun:8.3f} ms")
+    print(f"old clear (rebuild + 2 runs): {old_total:8.3f} ms")
+    print(f"new clear (reset + 1 run):    {new_total:8.3f} ms  ({old_total / new_total:.1f}x faster)")
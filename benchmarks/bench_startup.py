@@ -0,0 +1,68 @@
+"""Benchmarks time-to-first-paint for a new visitor.
+
+main.py used to import LangChain/langchain_groq at the top of the script, so the
+title and disclaimer could only be sent once those imports had finished. The
+chat backend is now imported on the first message (or prewarmed in the
+background), and the page shell renders without it.
+
+"Before" is main.py as it is now with the backend imported at the top of the
+script again, so both are timed the same way: one full AppTest run of the
+script, in a fresh interpreter so imports are cold. Run from the repository
+root (nothing is sent to Groq):
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+
+# Time to import the chat backend, i.e. what used to run before st.title()
+IMPORT_BACKEND = """
+import time
+start = time.perf_counter()
+import chatbot
+print((time.perf_counter() - start) * 1000)
+"""
+
+# Time for the first full script run of main.py: as it is now ("lazy"), or with
+# the chat backend imported at the top of the script as it used to be ("eager")
+FIRST_RUN = """
+import sys
+import time
+from streamlit.testing.v1 import AppTest
+with open("main.py") as f:
+    script = f.read()
+if sys.argv[1] == "eager":
+    script = "import chatbot\\n" + script
+app = AppTest.from_string(script, default_timeout=60)
+start = time.perf_counter()
+app.run()
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def measure(code, *args):
+    env = dict(os.environ, GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "benchmark-key"))
+    samples = []
+    for _ in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, "-c", code, *args], cwd=REPO_ROOT, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+if __name__ == "__main__":
+    import_ms = measure(IMPORT_BACKEND)
+    before_ms = measure(FIRST_RUN, "eager")
+    after_ms = measure(FIRST_RUN, "lazy")
+
+    print(f"cold import of chat backend:   {import_ms:8.1f} ms")
+    print(f"time to first paint, before:   {before_ms:8.1f} ms  (backend imported at the top)")
+    print(f"time to first paint, after:    {after_ms:8.1f} ms  (backend imported lazily / prewarmed)")
+    print(f"saved on first paint:          {before_ms - after_ms:8.1f} ms  ({before_ms / after_ms:.1f}x)")
@@ -0,0 +1,237 @@
+"""A local stand-in for the Groq chat-completions API, for offline benchmarking.
+
+Speaks the same OpenAI-compatible protocol the groq SDK (and so ChatGroq) uses,
+including SSE streaming, with configurable latency, throughput and failures:
+
+    python benchmarks/fake_groq_server.py --port 8787 --ttft 0.3 --tokens-per-sec 80
+
+Then point the app (or any benchmark) at it instead of api.groq.com:
+
+    GROQ_API_BASE=http://127.0.0.1:8787 GROQ_API_KEY=fake streamlit run main.py
+
+Any API key is accepted. It can also be started in-process with start_server().
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATHS = ("/openai/v1/chat/completions", "/v1/chat/completions")
+
+REPLY = (
+    "I'm really glad you shared that with me. It sounds like you've been carrying a lot "
+    "lately, and it makes sense to feel worn down. Would it help to talk a little more "
+    "about what has been weighing on you the most? Sometimes a few slow, deep breaths or "
+    "a short walk can take the edge off, but there's no pressure. I'm here to listen."
+)
+
+
+class FakeGroqConfig:
+    """Knobs for the fake server. Times are in seconds, rates are probabilities 0-1."""
+
+    def __init__(self, ttft=0.25, tokens_per_sec=100.0, reply_tokens=60, error_rate=0.0,
+                 rate_limit_rate=0.0, requests_per_minute=0, retry_after=1.0):
+        self.ttft = ttft # Delay before the first token (or before the full response)
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens # Length of every reply, in whitespace-separated tokens
+        self.error_rate = error_rate # Chance of a 500/503 response
+        self.rate_limit_rate = rate_limit_rate # Chance of a random 429 response
+        self.requests_per_minute = requests_per_minute # Real RPM limit enforced with 429s (0 = none)
+        self.retry_after = retry_after # Value of the Retry-After header on 429s
+
+
+def reply_tokens(count):
+    words = REPLY.split()
+    return [word + " " for word in itertools.islice(itertools.cycle(words), count)]
+
+
+class _RequestLimiter:
+    """Fixed one-minute window request counter, like a provider's RPM quota."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._lock = threading.Lock()
+        self._window = 0
+        self._count = 0
+
+    def allow(self):
+        if not self.per_minute:
+            return True
+        with self._lock:
+            window = int(time.time() // 60)
+            if window != self._window:
+                self._window, self._count = window, 0
+            self._count += 1
+            return self._count <= self.per_minute
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, so client connection pooling behaves as with Groq
+    ids = itertools.count(1)
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path not in COMPLETIONS_PATHS:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        request = json.loads(body or b"{}")
+
+        if not self.server.limiter.allow() or random.random() < self.config.rate_limit_rate:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached. Please try again later.",
+                           "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": f"{self.config.retry_after:g}"},
+            )
+            return
+        if random.random() < self.config.error_rate:
+            status = random.choice((500, 503))
+            self._send_json(status, {"error": {"message": "Internal server error", "type": "internal_server_error"}})
+            return
+
+        model = request.get("model", "fake")
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        tokens = reply_tokens(self.config.reply_tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+        }
+        completion_id = f"chatcmpl-fake-{next(self.ids)}"
+
+        if request.get("stream"):
+            self._stream(completion_id, model, tokens, usage)
+        else:
+            time.sleep(self.config.ttft + len(tokens) / self.config.tokens_per_sec)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+    def _stream(self, completion_id, model, tokens, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None, **extra):
+            event = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+
+        try:
+            time.sleep(self.config.ttft)
+            chunk({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(1 / self.config.tokens_per_sec)
+                chunk({"content": token})
+            chunk({}, "stop", x_groq={"id": completion_id, "usage": usage})
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("") # Terminating zero-length chunk
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True # The client cancelled the request
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeGroqHandler)
+        self.config = config
+        self.limiter = _RequestLimiter(config.requests_per_minute)
+
+    def handle_error(self, request, client_address):
+        pass # Clients dropping connections (cancelled or retried requests) is expected here
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Starts the fake server on a background thread and returns it (see .base_url)."""
+    server = FakeGroqServer((host, port), config or FakeGroqConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--ttft", type=float, default=0.25, help="seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0)
+    parser.add_argument("--reply-tokens", type=int, default=60, help="tokens in every reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance of a 500/503 response")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="chance of a random 429 response")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on 429s")
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(
+        ttft=args.ttft,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        requests_per_minute=args.rpm,
+        retry_after=args.retry_after,
+    )
+    server = FakeGroqServer((args.host, args.port), config)
+    print(f"Fake Groq API listening on {server.base_url} (set GROQ_API_BASE to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
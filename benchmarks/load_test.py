@@ -0,0 +1,243 @@
+"""End-to-end load test: N concurrent users holding multi-turn conversations.
+
+Each simulated user gets its own MessageStore and conversation from
+initialize_chain (the same request path main.py uses, minus the Streamlit UI)
+and streams replies from the fake Groq server, which runs in a separate
+process. For every combination of session count and conversation length it
+reports throughput, turn latency percentiles, time to first token and the
+memory retained per session (its message store and memory, measured after the
+run so the measurement doesn't slow the turns down). First, it compares
+sequential turns on one shared, pooled client (as get_llm provides) with a
+fresh client, and so a fresh connection, per turn.
+
+Run from the repository root (no network needed):
+
+    python benchmarks/load_test.py --sessions 1,10,50,100 --turns 5,20
+
+Pass --base-url to load-test a fake server you started yourself (or any other
+compatible endpoint).
+"""
+import argparse
+import gc
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+USER_MESSAGES = [
+    "I've been feeling really overwhelmed with work lately.",
+    "It's hard to sleep, my mind keeps racing at night.",
+    "I guess I'm worried I'm letting everyone down.",
+    "Talking about it helps a bit, thank you.",
+    "What are some small things I could try this week?",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_server(args):
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCHMARKS_DIR, "fake_groq_server.py"),
+        "--port", str(port),
+        "--ttft", str(args.ttft),
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--reply-tokens", str(args.reply_tokens),
+        "--error-rate", str(args.error_rate),
+    ], stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("fake Groq server did not start")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def session_bytes(conversation):
+    """Bytes reachable from one session's store and memory, excluding shared objects."""
+    shared = {id(conversation.llm), id(conversation.memory.token_counter)}
+    seen = set()
+    pending = [conversation.store, conversation.memory]
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or id(obj) in shared or isinstance(obj, (type, type(sys), type(len))):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def connection_reuse(base_url, turns):
+    """Per-turn latencies of sequential turns on one shared pooled client, and on a fresh client per turn."""
+    import asyncio
+
+    import httpx
+    from langchain_core.messages import HumanMessage
+
+    from backends import create_chat_model
+    from chatbot import HTTP_POOL_LIMITS
+    from config import DEFAULT_MODEL
+
+    def new_client(http_client):
+        return create_chat_model(
+            "groq", DEFAULT_MODEL, os.environ["GROQ_API_KEY"], base_url=base_url, http_async_client=http_client,
+        )
+
+    async def stream_reply(client):
+        async for _ in client.astream([HumanMessage(content=USER_MESSAGES[0])]):
+            pass
+
+    async def measure():
+        async with httpx.AsyncClient(limits=HTTP_POOL_LIMITS) as http_client:
+            shared = new_client(http_client)
+            await stream_reply(shared) # Opens the connection the timed turns reuse
+            pooled = []
+            for _ in range(turns):
+                start = time.perf_counter()
+                await stream_reply(shared)
+                pooled.append(time.perf_counter() - start)
+
+        fresh = []
+        for _ in range(turns):
+            start = time.perf_counter()
+            async with httpx.AsyncClient(limits=HTTP_POOL_LIMITS) as http_client:
+                await stream_reply(new_client(http_client))
+            fresh.append(time.perf_counter() - start)
+        return pooled, fresh
+
+    pooled, fresh = asyncio.run(measure())
+    pooled_ms, fresh_ms = statistics.median(pooled) * 1000, statistics.median(fresh) * 1000
+    return (
+        f"connection reuse ({turns} sequential turns, p50): shared pooled client {pooled_ms:.1f} ms, "
+        f"fresh client per turn {fresh_ms:.1f} ms ({fresh_ms - pooled_ms:+.1f} ms)"
+    )
+
+
+def run_session(initialize_chain, store_factory, turns, think_time, results):
+    """One simulated user: a conversation of `turns` turns, recording each one's timings."""
+    store = store_factory()
+    conversation = initialize_chain(os.environ["GROQ_API_KEY"], store)
+    for turn in range(turns):
+        store.append("user", USER_MESSAGES[turn % len(USER_MESSAGES)])
+        start = time.perf_counter()
+        first_token = None
+        try:
+            chunks = []
+            for chunk in conversation.stream():
+                if first_token is None and chunk:
+                    first_token = time.perf_counter() - start
+                chunks.append(chunk)
+            conversation.save_reply("".join(chunks))
+        except Exception:
+            store.append(
+                "assistant", "Sorry, I encountered a problem processing your request. Please try again.",
+                display_only=True,
+            )
+            with results["lock"]:
+                results["errors"] += 1
+        else:
+            results["latencies"].append(time.perf_counter() - start)
+            results["ttfts"].append(first_token or 0.0)
+        if think_time:
+            time.sleep(think_time)
+    return conversation
+
+
+def run_scenario(sessions, turns, args):
+    from chatbot import initialize_chain
+    from history import MessageStore
+
+    results = {"latencies": [], "ttfts": [], "errors": 0, "lock": threading.Lock()}
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, initialize_chain, MessageStore, turns, args.think_time, results)
+            for _ in range(sessions)
+        ]
+        conversations = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    per_session = statistics.mean(session_bytes(conversation) for conversation in conversations)
+
+    latencies, ttfts = results["latencies"], results["ttfts"]
+    if not latencies:
+        return f"{sessions:>8} {turns:>6}  all {results['errors']} turns failed"
+    memory = f"{per_session / 1024:>9.1f} KiB"
+    return (
+        f"{sessions:>8} {turns:>6} {len(latencies) / elapsed:>9.1f} "
+        f"{percentile(latencies, 0.50) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+        f"{percentile(latencies, 0.99) * 1000:>8.0f} {statistics.median(ttfts) * 1000:>9.0f} "
+        f"{results['errors']:>7} {memory}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default="1,10,50", help="comma-separated concurrent session counts")
+    parser.add_argument("--turns", default="5,20", help="comma-separated conversation lengths")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds each user waits between turns")
+    parser.add_argument("--base-url", help="use this endpoint instead of starting a fake server")
+    parser.add_argument("--ttft", type=float, default=0.2, help="fake server time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0, help="fake server output speed")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="fake server reply length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake server 5xx rate")
+    parser.add_argument("--reuse-turns", type=int, default=20,
+                        help="turns for the shared vs. fresh client comparison (0 skips it)")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="keep the app's client-side RPM/TPM limits (off by default, as they cap throughput)")
+    args = parser.parse_args()
+
+    if not args.rate_limits:
+        from config import RATE_LIMITS
+        RATE_LIMITS.clear()
+
+    import streamlit.logger
+    streamlit.logger.set_log_level("error") # Silence "missing ScriptRunContext" outside `streamlit run`
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        server, base_url = start_fake_server(args)
+    os.environ["GROQ_API_BASE"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "load-test-key")
+
+    try:
+        print(f"target: {base_url}")
+        if args.reuse_turns:
+            print(connection_reuse(base_url, args.reuse_turns), flush=True)
+        print(f"{'sessions':>8} {'turns':>6} {'turns/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'ttft p50':>9} {'errors':>7} {'mem/session':>13}")
+        for turns in (int(value) for value in args.turns.split(",")):
+            for sessions in (int(value) for value in args.sessions.split(",")):
+                print(run_scenario(sessions, turns, args), flush=True)
+    finally:
+        if server is not None:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,868 @@
+import logging
+import time
+
+import httpx
+import streamlit as st
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import HumanMessage, SystemMessage
+from backends import API_CONNECTION_ERRORS, API_STATUS_ERRORS, HealthCheck, create_chat_model, load_backends
+from config import (
+    BACKEND_HEALTH_CHECK_SECONDS,
+    BACKEND_HEALTH_FAILURES,
+    BACKENDS,
+    CIRCUIT_FAILURE_RATIO,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_PROBE_SECONDS,
+    CIRCUIT_SLOW_CALL_SECONDS,
+    CIRCUIT_WINDOW,
+    CONTEXT_REPLY_TOKENS,
+    CONTEXT_UPGRADE_MODEL,
+    CONTEXT_WINDOWS,
+    DEFAULT_CONTEXT_WINDOW,
+    DEFAULT_HISTORY_TOKEN_BUDGET,
+    DEFAULT_MODEL,
+    ESTIMATED_REPLY_TOKENS,
+    HEDGE_DEFAULT_DELAY_SECONDS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_MODEL,
+    HEDGE_PERCENTILE,
+    HEDGE_REQUESTS,
+    HISTORY_TOKEN_BUDGETS,
+    KEY_AUTH_EVICTION_SECONDS,
+    KEY_QUOTA_EVICTION_SECONDS,
+    MEMORY_BACKEND,
+    MODEL_PRICES,
+    MODEL_ROUTING,
+    RATE_LIMITS,
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_BUDGET_SECONDS,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY_SECONDS,
+    ROUTE_DEEP_CONVERSATION_TURNS,
+    ROUTE_HEAVY_SCORE,
+    ROUTE_LONG_MESSAGE_WORDS,
+    ROUTE_MODELS,
+    SUMMARY_RECENT_TURNS,
+    TURN_TIMEOUT_SECONDS,
+)
+from memory import PromptTooLong, RollingSummaryMemory, TokenCounter, TokenWindowMemory, fit_to_window
+from metrics import (
+    API_KEY_EVICTIONS,
+    BACKEND_HEALTHY,
+    CIRCUIT_OPEN,
+    CONTEXT_FITS,
+    LLM_FAILOVERS,
+    LLM_HEDGES,
+    LLM_IN_FLIGHT,
+    LLM_RETRIES,
+    REGISTRY,
+    ROUTED_TURNS,
+    TurnMetrics,
+)
+from ratelimit import KeyPool, KeyUnavailable, RequestScheduler
+from resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    RetryPolicy,
+    failover_call,
+    failover_stream,
+    get_event_loop,
+    hedged_call,
+    hedged_stream,
+    retry_after_seconds,
+    retry_call,
+    retry_stream,
+    run_with_deadline,
+    stream_with_deadline,
+)
+from router import ComplexityRouter
+
+logger = logging.getLogger(__name__)
+
+# Shared HTTP connection pool for all sessions (see get_llm)
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+# --- Prompt Template ---
+# This is CRUCIAL for setting the chatbot's persona and boundaries
+SYSTEM_PROMPT = """
+You are 'Mindful Echo', a supportive and empathetic AI companion designed for mental well-being conversations.
+Your goal is to listen actively, offer encouragement, and provide a safe, non-judgmental space for users to express their feelings.
+
+**Guidelines:**
+*   **Be Kind and Empathetic:** Respond with warmth, understanding, and compassion. Validate the user's feelings.
+*   **Listen Actively:** Pay close attention to what the user shares. Ask clarifying questions gently if needed.
+*   **Be Non-Judgmental:** Create a safe space where the user feels comfortable sharing without fear of criticism.
+*   **Offer General Support & Encouragement:** Provide positive affirmations and gentle encouragement. You can suggest general, widely accepted well-being practices (like mindfulness, deep breathing, taking a walk) if appropriate, but frame them as suggestions, not directives.
+*   **Maintain Neutrality:** Avoid giving personal opinions, specific advice (especially medical, financial, or legal), or making decisions for the user.
+*   **Do Not Diagnose:** You are NOT a therapist or medical professional. Do not attempt to diagnose any condition.
+*   **Prioritize Safety:** If a user expresses thoughts of harming themselves or others, gently guide them towards professional help immediately. Provide contact information for crisis hotlines or emergency services (you can state: "If you are in immediate danger, please contact your local emergency services or a crisis hotline like [mention a relevant hotline, e.g., the National Suicide Prevention Lifeline at 988 in the US].").
+*   **Manage Limitations:** Remind the user that you are an AI and cannot replace professional human support. If the conversation becomes too complex or requires professional expertise, gently suggest seeking help from a qualified therapist, counselor, or doctor.
+*   **Use Conversational History:** Remember previous parts of the conversation to provide relevant and coherent responses.
+
+**Example Interaction Start:**
+User: I've been feeling really down lately.
+Mindful Echo: I'm really sorry to hear you've been feeling down. It sounds tough. I'm here to listen if you'd like to share more about what's been going on. Remember, your feelings are valid.
+
+Remember your core purpose: To be a supportive listener and a beacon of gentle encouragement.
+"""
+
+prompt_template = ChatPromptTemplate.from_messages(
+    [
+        ("system", SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}"),
+    ]
+)
+# The system prompt has no template variables, so one message object serves every prompt
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+SYSTEM_PROMPT_TOKENS = TokenCounter().count_message(SYSTEM_MESSAGE) # Part of every prompt; counted once
+
+# --- Shared LLM Client ---
+# st.cache_resource keeps one client per (provider, endpoint, model, temperature) for
+# the whole process, so every session reuses the same keep-alive HTTP connections
+# instead of opening its own. The clients and httpx.Client are thread-safe; only
+# memory is per session.
+@st.cache_resource(show_spinner=False)
+def get_llm(api_key, model_name=DEFAULT_MODEL, temperature=0.7, provider="groq", base_url=None):
+    """Returns the process-wide chat model client for this provider, model and temperature.
+
+    Retries are off in the client: Conversation retries with its own RetryPolicy,
+    which is budgeted and measured.
+    """
+    return create_chat_model(
+        provider,
+        model_name,
+        api_key,
+        # For Groq, None means the real API (see backends.load_backends for GROQ_API_BASE)
+        base_url=base_url,
+        temperature=temperature, # Adjust for creativity vs. consistency
+        http_client=httpx.Client(limits=HTTP_POOL_LIMITS),
+        # Turns run on resilience's shared event loop, so this pool is only ever used from that loop
+        http_async_client=httpx.AsyncClient(limits=HTTP_POOL_LIMITS),
+    )
+
+
+# --- Rate Limiting ---
+# One scheduler per (API key, model), shared by every session in the process, as
+# Groq's quotas are. Requests queue there instead of racing each other into 429s.
+@st.cache_resource(show_spinner=False)
+def get_scheduler(api_key, model_name):
+    """Returns the process-wide RPM/TPM scheduler for this key and model (None if it has no limits)."""
+    limits = RATE_LIMITS.get(model_name)
+    return RequestScheduler(*limits) if limits else None
+
+
+@st.cache_resource(show_spinner=False)
+def get_key_pool(api_keys):
+    """Returns the process-wide pool tracking which of these API keys are evicted."""
+    return KeyPool(api_keys)
+
+
+class _Charge:
+    """Quota one request reserved on a scheduler: how long it queued, and whether its reply was used."""
+
+    __slots__ = ("scheduler", "side", "queue_wait", "answered")
+
+    def __init__(self, scheduler, side, queue_wait):
+        self.scheduler = scheduler
+        self.side = side # "primary" or "hedge": which contender of a hedged request sent it
+        self.queue_wait = queue_wait
+        self.answered = False
+
+
+# --- Circuit Breakers ---
+PROBE_MESSAGES = [HumanMessage(content="ping")]
+
+
+def _on_circuit_change(model_name):
+    def on_state_change(old, new):
+        if old == "closed":
+            CIRCUIT_OPEN.inc(model_name)
+        elif new == "closed":
+            CIRCUIT_OPEN.dec(model_name)
+    return on_state_change
+
+
+@st.cache_resource(show_spinner=False)
+def get_breaker(api_key, model_name, provider="groq", base_url=None):
+    """Returns the process-wide circuit breaker for this model, which probes it with this key."""
+    llm = get_llm(api_key, model_name, provider=provider, base_url=base_url)
+    return CircuitBreaker(
+        probe=lambda: llm.ainvoke(PROBE_MESSAGES, max_tokens=1),
+        window=CIRCUIT_WINDOW,
+        min_calls=CIRCUIT_MIN_CALLS,
+        failure_ratio=CIRCUIT_FAILURE_RATIO,
+        slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS,
+        probe_interval=CIRCUIT_PROBE_SECONDS,
+        on_state_change=_on_circuit_change(model_name),
+    )
+
+
+# --- Backend Health ---
+def _on_health_change(backend_name):
+    def on_change(healthy):
+        if healthy:
+            BACKEND_HEALTHY.inc(backend_name)
+        else:
+            BACKEND_HEALTHY.dec(backend_name)
+    return on_change
+
+
+@st.cache_resource(show_spinner=False)
+def get_health_check(backend_name, url, api_key):
+    """Starts (once per process) the background health check of one backend and returns it."""
+    BACKEND_HEALTHY.inc(backend_name) # Counted healthy until a check fails
+    check = HealthCheck(
+        url, api_key, interval=BACKEND_HEALTH_CHECK_SECONDS, failures=BACKEND_HEALTH_FAILURES,
+        on_change=_on_health_change(backend_name),
+    )
+    return check.start(get_event_loop())
+
+
+# --- Retry Policy ---
+def is_transient_error(error):
+    """True for provider failures worth retrying: 408/409/429, 5xx, timeouts and dropped connections."""
+    if isinstance(error, API_STATUS_ERRORS):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    # KeyUnavailable: the key was evicted and the request can go to another one
+    return isinstance(error, API_CONNECTION_ERRORS + (KeyUnavailable,)) # Includes timeouts
+
+
+def is_provider_failure(error):
+    """True for failures that say the provider itself is unhealthy: 5xx, timeouts, dropped connections."""
+    if isinstance(error, API_STATUS_ERRORS):
+        return error.status_code >= 500
+    return isinstance(error, API_CONNECTION_ERRORS)
+
+
+def should_fail_over(error):
+    """True if a failed request should move on to the next backend rather than fail the turn.
+
+    Outages, exhausted quotas and rejected keys do; requests the provider found
+    invalid (other 4xx) would fail on any backend, so they don't.
+    """
+    if isinstance(error, (CircuitOpen, KeyUnavailable)) or is_transient_error(error):
+        return True
+    return isinstance(error, API_STATUS_ERRORS) and error.status_code in (401, 403)
+
+
+def prompt_limit(model):
+    """Most prompt tokens one request to model can carry, leaving room for the reply.
+
+    That is its context window, and for rate-limited models also its tokens-per-minute
+    quota: the scheduler can't hold back a request bigger than the whole bucket, so
+    the provider would reject it instead.
+    """
+    limit = CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - CONTEXT_REPLY_TOKENS
+    limits = RATE_LIMITS.get(model)
+    if limits is not None:
+        limit = min(limit, limits[1] - ESTIMATED_REPLY_TOKENS)
+    return limit
+
+
+@st.cache_resource(show_spinner=False)
+def get_upgrade_model(model_names):
+    """Returns CONTEXT_UPGRADE_MODEL if it takes longer prompts than one of model_names, else None.
+
+    Its prompt_limit includes its token quota, which can be smaller than the window
+    of the models it would relieve (as with Groq's free-tier quotas). Upgrading is
+    then never possible, so it's turned off, and logged once per process.
+    """
+    if CONTEXT_UPGRADE_MODEL is None:
+        return None
+    smallest = min(model_names, key=prompt_limit)
+    if prompt_limit(CONTEXT_UPGRADE_MODEL) > prompt_limit(smallest):
+        return CONTEXT_UPGRADE_MODEL
+    logger.warning(
+        "Context upgrades are off: %s takes at most %d prompt tokens, no more than %s (%d); "
+        "raise its RATE_LIMITS entry to match your plan. Oversized prompts are trimmed instead.",
+        CONTEXT_UPGRADE_MODEL, prompt_limit(CONTEXT_UPGRADE_MODEL), smallest, prompt_limit(smallest),
+    )
+    return None
+
+
+def estimate_cost(model, prompt_tokens, output_tokens):
+    """Provider cost of a request in US$ from MODEL_PRICES, or None for models without a price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+
+RETRY_POLICY = RetryPolicy(
+    max_attempts=RETRY_MAX_ATTEMPTS,
+    base_delay=RETRY_BASE_DELAY_SECONDS,
+    max_delay=RETRY_MAX_DELAY_SECONDS,
+    budget=RETRY_BUDGET_SECONDS,
+    retryable=is_transient_error,
+    rerouted=lambda error: isinstance(error, KeyUnavailable),
+)
+
+
+# --- Conversation Pipeline ---
+class Conversation:
+    """One session's conversation: prompt -> model -> text, over its message store.
+
+    The session's MessageStore is the only copy of the history: the UI appends the
+    user's message to it, memory picks which stored messages go into the prompt,
+    and the reply is appended back once it's complete. The prompt is formatted
+    directly rather than piped through a Runnable sequence (prompt | llm | parser),
+    which costs more per call than the ConversationChain it replaced.
+
+    Calls to the model run on a shared event loop with a per-turn deadline; past it,
+    the request is cancelled and resilience.TurnTimeout is raised with nothing stored.
+    Transient failures before the reply starts are retried under retry_policy, and
+    if a hedge_llm is given, slow starts are hedged against it (see _hedge_after).
+    Each request is sent on one of its target's routes, (API key, client, scheduler):
+    with a key_pool, the key with the most quota headroom, after waiting for that
+    key's rate-limit scheduler if it has one. While a model's circuit breaker is
+    open, turns fail fast with resilience.CircuitOpen instead.
+
+    fallback_llms are other backends' clients, tried in order when a request to the
+    one before fails with an outage, quota or key error (see should_fail_over).
+    Backends whose circuit is open or whose health check fails are skipped, unless
+    only failed health checks would leave nothing to try. CircuitOpen is raised
+    once every backend's circuit is open: that takes failed real requests.
+
+    With a router, each turn's primary client is picked from `models` by the
+    router's decision for the pending message; llm is used for anything else.
+    The assembled prompt is measured against the primary model's prompt_limit
+    (context window and token quota) before anything is sent: if it doesn't fit,
+    the turn moves to upgrade_model (one of `models`) when the prompt fits there,
+    and otherwise the oldest history is trimmed. memory.PromptTooLong is raised if
+    even the input alone is too long. Fallbacks it doesn't fit are skipped.
+    """
+
+    def __init__(self, llm, store, memory, timeout=TURN_TIMEOUT_SECONDS, retry_policy=RETRY_POLICY, hedge_llm=None,
+                 routes=None, key_pool=None, breakers=None, fallback_llms=(), health=None, router=None, models=None,
+                 upgrade_model=None, targets=None):
+        self.llm = llm
+        self.store = store
+        self.memory = memory
+        self.timeout = timeout # Seconds a turn may take before it's cancelled
+        self.retry_policy = retry_policy
+        self.hedge_llm = hedge_llm
+        # routes, breakers and health are keyed by target: the (backend name, model name) a
+        # client serves, so backends offering the same model don't overwrite each other
+        self.routes = routes or {} # Target -> [(api_key, client, scheduler or None), ...]
+        self.key_pool = key_pool
+        self.breakers = breakers or {} # Target -> CircuitBreaker
+        self.fallback_llms = list(fallback_llms)
+        self.health = health or {} # Target -> backends.HealthCheck
+        self.targets = targets or {} # id(client) -> target, for every client a turn may use
+        self.router = router
+        self.models = models or {} # Model name -> client the router may pick
+        self.upgrade_model = upgrade_model # Larger-context model for prompts that don't fit
+        self._primary = llm # This turn's primary client
+        self._prompt_tokens = 0 # Measured size of this turn's prompt
+        self._rate_limited = any(scheduler for model_routes in self.routes.values() for _, _, scheduler in model_routes)
+        self.last_turn = None # TurnMetrics of the most recent invoke()/stream()
+        self._charges = [] # _Charge per request this turn sent through a scheduler
+        self._prepared = None # (pending message, turn, messages) once expected_wait() has started its turn
+
+    def build_messages(self):
+        """Assembles the prompt: system prompt, history and the pending user input.
+
+        Same messages as prompt_template.format_messages(), without re-rendering the
+        system prompt and re-validating the history on every turn.
+        """
+        return [SYSTEM_MESSAGE, *self.memory.load_messages()]
+
+    def _pick_llm(self):
+        """Returns the primary client for the pending message and the router's decision (None without one)."""
+        if self.router is None:
+            return self.llm, None
+        decision = self.router.route(self.store[-1].content, len(self.store) // 2)
+        return self.models.get(decision.model, self.llm), decision
+
+    def _start_turn(self):
+        """Routes the turn and builds its prompt, timing that into a fresh TurnMetrics."""
+        start = time.perf_counter()
+        self._primary, decision = self._pick_llm()
+        model = getattr(self._primary, "model_name", type(self._primary).__name__)
+        self.last_turn = turn = TurnMetrics(model)
+        if decision is not None:
+            turn.route = decision.route
+            ROUTED_TURNS.inc(decision.route, decision.reason)
+        self._charges.clear()
+        messages = self._fit_context(turn, self.build_messages())
+        turn.prompt_assembly = time.perf_counter() - start
+        return turn, messages
+
+    def _prepare(self):
+        """Returns the (turn, messages) for the pending message, starting the turn the first time it's asked."""
+        pending = self.store[-1]
+        if self._prepared is None or self._prepared[0] is not pending:
+            self._prepared = (pending, *self._start_turn())
+        return self._prepared[1:]
+
+    def _take_turn(self):
+        """Returns the prepared (turn, messages) for the pending message; the next call starts a new turn."""
+        turn, messages = self._prepare()
+        self._prepared = None
+        return turn, messages
+
+    def _fit_context(self, turn, messages):
+        """Returns the prompt to send, upgrading the turn's model or trimming history if it's too long.
+
+        messages must be the prompt build_messages() just returned: their token
+        counts are the ones memory cached while loading them.
+        """
+        counts = [SYSTEM_PROMPT_TOKENS, *self.memory.last_counts] # Cached: nothing is re-tokenized per turn
+        self._prompt_tokens = sum(counts)
+        limit = prompt_limit(turn.model)
+        if self._prompt_tokens <= limit:
+            return messages
+
+        upgrade = self.models.get(self.upgrade_model)
+        if upgrade is not None and self._prompt_tokens <= prompt_limit(self.upgrade_model) and self._available(upgrade):
+            CONTEXT_FITS.inc(turn.model, "upgraded")
+            self._primary, turn.model, turn.context = upgrade, self.upgrade_model, "upgraded"
+            return messages
+
+        try:
+            messages, self._prompt_tokens = fit_to_window(messages, counts, limit)
+        except PromptTooLong:
+            CONTEXT_FITS.inc(turn.model, "too_long")
+            raise
+        CONTEXT_FITS.inc(turn.model, "trimmed")
+        turn.context = "trimmed"
+        return messages
+
+    def _target(self, llm):
+        """The (backend name, model name) llm serves: the key of its routes, breaker and health check."""
+        return self.targets.get(id(llm))
+
+    def _route(self, llm, peek=False):
+        """Picks the (api_key, client, scheduler) to send the next request for llm's target on.
+
+        With peek, returns the route the next request would take without counting it as sent.
+        """
+        routes = self.routes.get(self._target(llm))
+        if not routes:
+            return None, llm, None
+        if self.key_pool is None or len(routes) == 1:
+            return routes[0]
+        if peek:
+            return self.key_pool.peek(routes, llm.model_name)
+        return self.key_pool.pick(routes, llm.model_name)
+
+    def expected_wait(self):
+        """Seconds the pending turn is expected to queue for rate limits (0.0 if it can go now).
+
+        Routes the turn and builds its prompt, which stream() or invoke() then reuse.
+        Raises PromptTooLong as they would.
+        """
+        self._prepare()
+        _, _, scheduler = self._route(self._primary, peek=True)
+        if scheduler is None:
+            return 0.0
+        return scheduler.expected_wait(self._prompt_tokens + ESTIMATED_REPLY_TOKENS)
+
+    def _on_retry(self, turn):
+        """Returns the callback that records each retry (and its backoff) on the turn."""
+        def on_retry(error, delay):
+            turn.retries += 1
+            turn.retry_wait = (turn.retry_wait or 0.0) + delay
+            LLM_RETRIES.inc(turn.model, str(getattr(error, "status_code", type(error).__name__)))
+        return on_retry
+
+    def _on_request_error(self, api_key, model, scheduler, error):
+        """Reacts to a failed request: backs off its key, or evicts it if others can take over.
+
+        A 429 only evicts the key for this model, as quotas are per model; a
+        401/403 evicts it for every model. Raises KeyUnavailable (which is
+        retried at once) when the request should move to another key.
+        """
+        status = getattr(error, "status_code", None)
+        if status not in (401, 403, 429):
+            return
+        retry_after = retry_after_seconds(error)
+        if self.key_pool is not None and api_key in self.key_pool.keys: # Not for other backends' keys
+            if status == 429:
+                self.key_pool.evict(api_key, retry_after or KEY_QUOTA_EVICTION_SECONDS, model)
+            else:
+                self.key_pool.evict(api_key, KEY_AUTH_EVICTION_SECONDS)
+            API_KEY_EVICTIONS.inc(str(status))
+            if self.key_pool.available(model):
+                raise KeyUnavailable(str(error)) from error
+        elif status == 429 and retry_after and scheduler is not None:
+            scheduler.hold(retry_after) # Every session backs off, not just this one
+
+    def _breaker(self, llm):
+        return self.breakers.get(self._target(llm))
+
+    def _record_health(self, breaker, start, first_response, error=None):
+        """Feeds one request's outcome to its model's circuit breaker."""
+        if breaker is None:
+            return
+        elapsed = first_response if first_response is not None else time.monotonic() - start
+        if error is None:
+            breaker.record_success(elapsed)
+        elif is_provider_failure(error) or elapsed >= breaker.slow_call_seconds:
+            breaker.record_failure() # Includes calls cancelled at the deadline after waiting too long
+
+    async def _charge(self, scheduler, side, reserved, charges=None):
+        """Waits for scheduler to grant the request's quota; returns the _Charge recording it."""
+        if scheduler is None:
+            return None
+        charge = _Charge(scheduler, side, await scheduler.acquire(self, reserved))
+        (self._charges if charges is None else charges).append(charge)
+        return charge
+
+    async def _send(self, turn, llm, messages, reserved, side, charges=None):
+        """Sends one request for the full reply on a route picked for llm's target.
+
+        Its _Charge is recorded in charges (by default the current turn's).
+        """
+        api_key, client, scheduler = self._route(llm)
+        breaker = self._breaker(llm)
+        if breaker is not None:
+            breaker.check()
+        charge = await self._charge(scheduler, side, reserved, charges)
+        start = time.monotonic()
+        try:
+            response = await client.ainvoke(messages)
+        except BaseException as e:
+            self._record_health(breaker, start, None, e)
+            if isinstance(e, Exception):
+                self._on_request_error(api_key, getattr(llm, "model_name", None), scheduler, e)
+            raise
+        self._record_health(breaker, start, time.monotonic() - start)
+        if charge is not None:
+            charge.answered = True
+        return response
+
+    async def _send_stream(self, turn, llm, messages, reserved, side):
+        """Streams one request for the reply on a route picked for llm's target."""
+        api_key, client, scheduler = self._route(llm)
+        breaker = self._breaker(llm)
+        if breaker is not None:
+            breaker.check()
+        charge = await self._charge(scheduler, side, reserved)
+        start = time.monotonic()
+        first_chunk = None
+        try:
+            async for chunk in client.astream(messages):
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - start
+                yield chunk
+        except BaseException as e: # Also cancellation: the deadline passed, a hedge won or the reader left
+            self._record_health(breaker, start, first_chunk, e)
+            if isinstance(e, Exception):
+                self._on_request_error(api_key, getattr(llm, "model_name", None), scheduler, e)
+            raise
+        self._record_health(breaker, start, first_chunk)
+        if charge is not None:
+            charge.answered = True
+
+    def _available(self, llm, health=True):
+        """True unless llm's circuit is open or (with health) its backend fails its health check."""
+        target = self._target(llm)
+        breaker, check = self.breakers.get(target), self.health.get(target)
+        return (breaker is None or breaker.state == "closed") and (not health or check is None or check.healthy)
+
+    def _failover_order(self, turn):
+        """The clients to try this turn, in order: the available ones (the primary if none are).
+
+        Fallbacks the prompt doesn't fit (see prompt_limit) are left out. If health
+        checks alone rule out every backend, those with a closed circuit are still tried.
+        """
+        primary = self._primary
+        candidates = [
+            llm for llm in (primary, *self.fallback_llms)
+            if llm is primary or self._prompt_tokens <= prompt_limit(llm.model_name)
+        ]
+        clients = (
+            [llm for llm in candidates if self._available(llm)]
+            or [llm for llm in candidates if self._available(llm, health=False)]
+            or [primary]
+        )
+        if clients[0] is not primary:
+            LLM_FAILOVERS.inc(turn.model, clients[0].model_name) # Skipping the primary up front is a failover too
+            turn.model = clients[0].model_name
+        return clients
+
+    def _on_failover(self, turn, clients):
+        """Returns the callback that records moving the turn on to the next backend."""
+        def on_failover(index, error):
+            LLM_FAILOVERS.inc(turn.model, clients[index].model_name)
+            turn.model = clients[index].model_name
+        return on_failover
+
+    def _hedge_after(self, turn, metric):
+        """Seconds to wait on the primary model before hedging, or None if hedging is off.
+
+        The threshold is a high percentile of the metric over this model's recent turns
+        in this process, so only unusually slow calls are hedged.
+        """
+        if self.hedge_llm is None:
+            return None
+        threshold = REGISTRY.percentile(metric, HEDGE_PERCENTILE, model=turn.model, min_samples=HEDGE_MIN_SAMPLES)
+        return HEDGE_DEFAULT_DELAY_SECONDS if threshold is None else threshold
+
+    def _on_hedge(self, turn):
+        """Returns the callback that records a fired hedge's outcome."""
+        hedge_model = getattr(self.hedge_llm, "model_name", type(self.hedge_llm).__name__)
+        def on_hedge(outcome):
+            turn.hedge = outcome
+            LLM_HEDGES.inc(hedge_model, outcome)
+            if outcome == "won":
+                turn.model = hedge_model # The reply (and its timings and tokens) came from the hedge
+        return on_hedge
+
+    def _call(self, turn, messages, reserved):
+        """Returns a coroutine factory for the full reply, with rate limiting, retries, hedging and failover applied."""
+        def attempt(llm, side="primary"):
+            request = lambda: self._send(turn, llm, messages, reserved, side)
+            return lambda: retry_call(request, self.retry_policy, self._on_retry(turn))
+
+        hedge_after = self._hedge_after(turn, "network_wait")
+        def source(llm):
+            if llm is not self._primary or hedge_after is None:
+                return attempt(llm)
+            return lambda: hedged_call(attempt(llm), attempt(self.hedge_llm, "hedge"), hedge_after, self._on_hedge(turn))
+
+        clients = self._failover_order(turn)
+        if len(clients) == 1:
+            return source(clients[0])
+        calls = [source(llm) for llm in clients]
+        return lambda: failover_call(calls, should_fail_over, self._on_failover(turn, clients))
+
+    def _stream(self, turn, messages, reserved):
+        """Returns an async iterator factory for the reply, with rate limiting, retries, hedging and failover applied."""
+        def attempt(llm, side="primary"):
+            request = lambda: self._send_stream(turn, llm, messages, reserved, side)
+            return lambda: retry_stream(request, self.retry_policy, self._on_retry(turn))
+
+        hedge_after = self._hedge_after(turn, "time_to_first_token")
+        def source(llm):
+            if llm is not self._primary or hedge_after is None:
+                return attempt(llm)
+            return lambda: hedged_stream(
+                attempt(llm), attempt(self.hedge_llm, "hedge"), hedge_after,
+                has_started=lambda chunk: bool(chunk.content), on_hedge=self._on_hedge(turn),
+            )
+
+        clients = self._failover_order(turn)
+        if len(clients) == 1:
+            return source(clients[0])
+        streams = [source(llm) for llm in clients]
+        return lambda: failover_stream(streams, should_fail_over, self._on_failover(turn, clients))
+
+    def _count_tokens(self, turn, reply, usage):
+        # Prefer the provider's counts; estimate locally if it didn't send any
+        if usage:
+            turn.prompt_tokens = usage["input_tokens"]
+            turn.output_tokens = usage["output_tokens"]
+        else:
+            turn.prompt_tokens = self._prompt_tokens
+            turn.output_tokens = self.memory.token_counter.count(reply)
+        turn.cost = estimate_cost(turn.model, turn.prompt_tokens, turn.output_tokens)
+
+    def _settle(self, turn, reserved):
+        """Corrects the token quota each of the turn's requests reserved with what it used.
+
+        The request whose reply was used is charged its real usage. The others
+        (retried, failed over, or the losing side of a hedge) keep only their
+        prompt and get the reply's reservation back. The turn's queue_wait is the
+        time the side that answered spent queued; the losing side's ran alongside it.
+        """
+        losing_side = "primary" if turn.hedge == "won" else "hedge"
+        waits = [charge.queue_wait for charge in self._charges if charge.side != losing_side]
+        if waits:
+            turn.queue_wait = sum(waits)
+        for charge in self._charges if reserved else ():
+            used = (turn.prompt_tokens or 0) + (turn.output_tokens or 0) if charge.answered else self._prompt_tokens
+            charge.scheduler.settle(reserved, used)
+        self._charges.clear()
+
+    def _check_circuit(self):
+        """Raises CircuitOpen if every backend's circuit is open (health checks alone never fail a turn)."""
+        if not any(self._available(llm, health=False) for llm in (self._primary, *self.fallback_llms)):
+            raise CircuitOpen("Every model backend is unavailable right now")
+
+    def invoke(self):
+        """Returns the full reply to the last stored user message and stores it."""
+        turn, messages = self._take_turn()
+        self._check_circuit()
+        reserved = self._prompt_tokens + ESTIMATED_REPLY_TOKENS if self._rate_limited else 0
+        request_start = time.perf_counter()
+        LLM_IN_FLIGHT.inc()
+        try:
+            response = run_with_deadline(self._call(turn, messages, reserved), self.timeout)
+        finally:
+            LLM_IN_FLIGHT.dec()
+        turn.network_wait = turn.generation_time = time.perf_counter() - request_start
+
+        reply = response.content
+        self._count_tokens(turn, reply, response.usage_metadata)
+        self._settle(turn, reserved)
+        self.save_reply(reply)
+        return reply
+
+    def stream(self):
+        """Returns an iterator over the reply to the last stored user message, chunk by chunk.
+
+        The caller stores the finished reply with save_reply() once the stream is done.
+        Time the caller spends between chunks (rendering them) is recorded as the
+        turn's render_time rather than as generation time. Raises CircuitOpen right
+        away, before anything is sent, while every backend is down.
+        """
+        turn, messages = self._take_turn()
+        self._check_circuit()
+        return self._stream_reply(turn, messages)
+
+    def _stream_reply(self, turn, messages):
+        reserved = self._prompt_tokens + ESTIMATED_REPLY_TOKENS if self._rate_limited else 0
+        request_start = time.perf_counter()
+        render_time = 0.0
+        usage = None
+        chunks = []
+
+        LLM_IN_FLIGHT.inc()
+        try:
+            for chunk in stream_with_deadline(self._stream(turn, messages, reserved), self.timeout):
+                elapsed = time.perf_counter() - request_start - render_time
+                if turn.network_wait is None:
+                    turn.network_wait = elapsed
+                if chunk.content and turn.time_to_first_token is None:
+                    turn.time_to_first_token = elapsed
+                if chunk.usage_metadata:
+                    usage = chunk.usage_metadata
+                chunks.append(chunk.content)
+
+                yielded = time.perf_counter()
+                yield chunk.content
+                render_time += time.perf_counter() - yielded
+        finally:
+            LLM_IN_FLIGHT.dec() # Also runs if the caller stops early or the stream fails
+
+        turn.generation_time = time.perf_counter() - request_start - render_time
+        turn.render_time = render_time
+        self._count_tokens(turn, "".join(chunks), usage)
+        self._settle(turn, reserved)
+
+    def complete(self, messages):
+        """Sends a one-off request outside the turn (e.g. memory's summary) and returns the reply text.
+
+        It goes to the session's default model through the same routes, rate limits,
+        retries, circuit breaker and deadline as a turn, and settles its own quota.
+        Runs from any thread; nothing is stored.
+        """
+        prompt_tokens = sum(self.memory.token_counter.count_message(message) for message in messages)
+        reserved = prompt_tokens + ESTIMATED_REPLY_TOKENS if self._rate_limited else 0
+        charges = []
+        request = lambda: self._send(None, self.llm, messages, reserved, "primary", charges)
+        response = run_with_deadline(lambda: retry_call(request, self.retry_policy), self.timeout)
+        usage = response.usage_metadata
+        for charge in charges if reserved else ():
+            used = usage["input_tokens"] + usage["output_tokens"] if charge.answered and usage else prompt_tokens
+            charge.scheduler.settle(reserved, used)
+        return response.content
+
+    def save_reply(self, reply):
+        self.store.append("assistant", reply)
+        self.memory.after_turn()
+
+
+# --- LangChain Initialization Function ---
+# We use a function to initialize to potentially allow model selection later
+def initialize_chain(api_key, store, model_name=DEFAULT_MODEL):
+    """Initializes the conversation for a new session over its message store.
+
+    api_key is one Groq API key or a list of them; requests are spread over the list.
+    The other backends in config.BACKENDS are set up as fallbacks, in order.
+    """
+    api_keys = [key for key in ([api_key] if isinstance(api_key, str) else api_key or ()) if key]
+    if not api_keys:
+        st.error("Groq API key is missing. Please set it in .env or Streamlit secrets.")
+        st.stop() # Stop execution if no API key
+
+    try:
+        # Backends in failover order; the first is the primary (Groq, on model_name)
+        clients = []
+        for backend in load_backends(BACKENDS, api_keys, model_name):
+            try:
+                client = get_llm(backend.api_keys[0], backend.model, provider=backend.provider, base_url=backend.base_url)
+            except (ImportError, ValueError) as e:
+                logger.warning("Backend %r skipped: %s", backend.name, e)
+                continue
+            clients.append((backend, backend.model, client))
+        if not clients:
+            raise RuntimeError("No model backend is usable; check BACKENDS in config.py")
+        (primary, _, llm), *fallbacks = clients
+
+        if MEMORY_BACKEND == "summary":
+            # Older turns are summarized in a background thread after each reply
+            # (sent through the conversation's complete(), set once it's built below)
+            memory = RollingSummaryMemory(store, recent_turns=SUMMARY_RECENT_TURNS)
+        else:
+            # Only the most recent turns that fit the model's history budget are resent
+            memory = TokenWindowMemory(
+                store,
+                max_token_limit=HISTORY_TOKEN_BUDGETS.get(primary.model, DEFAULT_HISTORY_TOKEN_BUDGET),
+            )
+
+        # Opt-in: a second model on the primary backend to race against slow starts of the first
+        hedge_llm = None
+        if HEDGE_REQUESTS and HEDGE_MODEL != primary.model:
+            hedge_llm = get_llm(primary.api_keys[0], HEDGE_MODEL, provider=primary.provider, base_url=primary.base_url)
+            clients.append((primary, HEDGE_MODEL, hedge_llm))
+
+        # Other models a turn may move to on the primary backend (Groq model names): the
+        # router's picks, and the larger-context model for prompts that don't fit
+        router, models, upgrade_model = None, {primary.model: llm}, None
+        if primary.provider == "groq":
+            if MODEL_ROUTING:
+                router = ComplexityRouter(
+                    ROUTE_MODELS,
+                    long_message_words=ROUTE_LONG_MESSAGE_WORDS,
+                    deep_conversation_turns=ROUTE_DEEP_CONVERSATION_TURNS,
+                    heavy_score=ROUTE_HEAVY_SCORE,
+                )
+            route_models = set(ROUTE_MODELS.values() if router else ()) | {primary.model}
+            upgrade_model = get_upgrade_model(tuple(sorted(route_models)))
+            extra_models = (route_models | {upgrade_model}) - {None, primary.model}
+            for model in sorted(extra_models):
+                models[model] = get_llm(primary.api_keys[0], model, provider=primary.provider, base_url=primary.base_url)
+                clients.append((primary, model, models[model]))
+
+        # Every model can be reached on every key of its backend; each (key, model) has its
+        # own client and its own process-wide RPM/TPM scheduler, as Groq's quotas do.
+        # Everything is keyed by (backend name, model): a fallback may serve the same model.
+        routes, breakers, health, targets = {}, {}, {}, {}
+        for backend, model, client in clients:
+            options = {"provider": backend.provider, "base_url": backend.base_url}
+            target = targets[id(client)] = (backend.name, model)
+            routes[target] = [
+                # RATE_LIMITS are Groq's quotas; a fallback serving the same model has its own
+                (key, get_llm(key, model, **options), get_scheduler(key, model) if backend.provider == "groq" else None)
+                for key in backend.api_keys
+            ]
+            breakers[target] = get_breaker(backend.api_keys[0], model, **options)
+            health[target] = get_health_check(backend.name, backend.models_url, backend.api_keys[0])
+        key_pool = get_key_pool(tuple(primary.api_keys)) if len(primary.api_keys) > 1 else None
+
+        conversation = Conversation(
+            llm, store, memory, hedge_llm=hedge_llm, routes=routes, key_pool=key_pool, breakers=breakers,
+            fallback_llms=[client for _, _, client in fallbacks], health=health, router=router, models=models,
+            upgrade_model=upgrade_model, targets=targets,
+        )
+        if MEMORY_BACKEND == "summary":
+            memory.send = conversation.complete # Summaries queue on the same rate limits and keys as turns
+        return conversation
+
+    except Exception as e:
+        st.error(f"Error initializing LangChain: {e}")
+        st.stop()
+
+
+def reset_conversation(chain):
+    """Empties the conversation's message store and memory in place.
+
+    The LLM client, prompt and chain are reused as-is, so clearing the chat costs
+    no more than emptying a list.
+    """
+    chain.store.clear()
+    chain.memory.clear()
@@ -0,0 +1,96 @@
+# Settings shared by the UI (main.py) and the chat backend (chatbot.py).
+# Kept free of heavy imports so the page can render before LangChain is loaded.
+
+# --- Constants ---
+DEFAULT_MODEL = "llama3-8b-8192" # Or try "mixtral-8x7b-32768", "llama3-70b-8192"
+# Tokens of conversation history sent with each turn, per model. Leaves room in the
+# context window for the system prompt, the user's message and the reply.
+HISTORY_TOKEN_BUDGETS = {
+    "llama3-8b-8192": 4096,
+    "llama3-70b-8192": 4096,
+    "mixtral-8x7b-32768": 16384,
+}
+DEFAULT_HISTORY_TOKEN_BUDGET = 4096
+# Context window of each model, in tokens. A prompt that wouldn't leave
+# CONTEXT_REPLY_TOKENS free for the reply is moved to CONTEXT_UPGRADE_MODEL if it
+# fits there, and otherwise has its oldest history trimmed before it's sent.
+CONTEXT_WINDOWS = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "llama3:8b": 8192, # Local fallback (see BACKENDS)
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+CONTEXT_REPLY_TOKENS = 1024 # Room kept free for the reply
+# None to always trim instead. Its prompt limit also counts its tokens-per-minute quota
+# (see RATE_LIMITS): on Groq's free tier mixtral's 5000 TPM is below the 8192-token
+# windows of the Llama models, so upgrades stay off (logged at startup) until it's raised.
+CONTEXT_UPGRADE_MODEL = "mixtral-8x7b-32768"
+# Per-turn model routing (see router.py): quick check-ins go to the "light" model,
+# long, deep, emotionally heavy or risky turns to the "heavy" one. Both run on the
+# primary backend; with routing off every turn uses DEFAULT_MODEL.
+MODEL_ROUTING = True
+ROUTE_MODELS = {"light": DEFAULT_MODEL, "heavy": "llama3-70b-8192"}
+ROUTE_LONG_MESSAGE_WORDS = 60 # A message this long is heavy on length alone
+ROUTE_DEEP_CONVERSATION_TURNS = 10 # Conversation depth at which depth adds its full share (half a heavy score)
+ROUTE_HEAVY_SCORE = 1.0 # Turns scoring this much (length + depth + intensity) go to the heavy model
+# Provider prices in US$ per million (prompt, output) tokens, for the per-route cost stats
+MODEL_PRICES = {
+    "llama3-8b-8192": (0.05, 0.08),
+    "llama3-70b-8192": (0.59, 0.79),
+    "mixtral-8x7b-32768": (0.24, 0.24),
+}
+MEMORY_BACKEND = "window" # "window" keeps recent turns within the token budget, "summary" folds older turns into a running summary
+SUMMARY_RECENT_TURNS = 3 # Turns kept verbatim by the "summary" backend
+RECORD_MESSAGE_TIMESTAMPS = False # Keep a timestamp on every stored message (costs ~24 bytes each)
+STREAM_RESPONSES = True # Show the reply token by token instead of waiting behind a spinner
+TURN_TIMEOUT_SECONDS = 45 # Give up on a reply (and cancel the request) if it isn't finished by then
+RETRY_MAX_ATTEMPTS = 3 # Tries per LLM call on 429/5xx/connection errors, including the first
+RETRY_BASE_DELAY_SECONDS = 0.5 # Backoff before the first retry (jittered), doubling each time
+RETRY_MAX_DELAY_SECONDS = 8 # Cap on a single backoff, unless the provider's Retry-After asks for longer
+RETRY_BUDGET_SECONDS = 15 # No retry starts if it would begin later than this after the first try
+# Requests and tokens per minute allowed per API key, by model (Groq's free-tier quotas;
+# raise them to match your plan). Models not listed here are not rate limited client-side.
+RATE_LIMITS = {
+    "llama3-8b-8192": (30, 30000),
+    "llama3-70b-8192": (30, 6000),
+    "mixtral-8x7b-32768": (30, 5000),
+}
+ESTIMATED_REPLY_TOKENS = 400 # Reply tokens reserved per request before sending; corrected once usage is known
+KEY_QUOTA_EVICTION_SECONDS = 30 # With several API keys, skip a key this long after a 429 (unless Retry-After says otherwise)
+KEY_AUTH_EVICTION_SECONDS = 600 # ...and this long after a 401/403
+CIRCUIT_WINDOW = 20 # Recent calls per model the circuit breaker judges provider health on
+CIRCUIT_MIN_CALLS = 10 # Calls needed in the window before the breaker can open
+CIRCUIT_FAILURE_RATIO = 0.5 # Open once this share of the window failed (5xx, timeouts) or was slow
+CIRCUIT_SLOW_CALL_SECONDS = 10 # A call counts as failed if its first token (or response) takes longer
+CIRCUIT_PROBE_SECONDS = 15 # While open, probe the provider this often; the first success closes the circuit
+# Model backends in failover order: the first is the primary, the rest take over when
+# it's down, out of quota or rejecting its keys. "groq" entries use the Groq API keys and,
+# without a "model", the model picked in the UI; "openai" entries are any OpenAI-compatible
+# endpoint, such as a local Ollama or llama.cpp server (needs langchain-openai). Entries
+# without an API key are skipped, as are entries with a base_url_env that isn't set and
+# no base_url to fall back on.
+BACKENDS = [
+    {"name": "groq", "provider": "groq"},
+    {
+        "name": "local",
+        "provider": "openai",
+        "model": "llama3:8b",
+        "base_url_env": "LOCAL_LLM_BASE_URL", # Only used once set, e.g. to Ollama's http://localhost:11434/v1
+        "api_key": "local", # Local servers ignore the key, but the client needs one
+    },
+]
+BACKEND_HEALTH_CHECK_SECONDS = 30 # How often each backend's model-list endpoint is polled
+BACKEND_HEALTH_FAILURES = 3 # Failed checks in a row before a backend is skipped (the circuit breaker still judges real requests)
+HEDGE_REQUESTS = False # Opt-in: if the model is unusually slow to start replying, also ask HEDGE_MODEL and use whichever answers first
+HEDGE_MODEL = "mixtral-8x7b-32768" # Secondary model for hedged requests
+HEDGE_PERCENTILE = 0.95 # Hedge once the wait for a first token passes this percentile of recent turns
+HEDGE_MIN_SAMPLES = 20 # Recent turns needed before the percentile is trusted
+HEDGE_DEFAULT_DELAY_SECONDS = 2.0 # Hedge threshold until then
+HISTORY_PAGE_SIZE = 50 # Messages shown on load; "Load earlier messages" pages in this many more
+FRAGMENT_TAIL_LIMIT = 20 # Messages the chat fragment redraws on each turn before a full rerun folds them into the history
+SHOW_METRICS_PANEL = False # Default state of the sidebar's latency metrics toggle
+METRICS_REFRESH_SECONDS = 5 # How often the metrics panel refreshes while it's shown
+METRICS_PORT = 9464 # Prometheus /metrics port for this process (env METRICS_PORT overrides, 0 disables)
+METRICS_HOST = "127.0.0.1" # Interface /metrics listens on (env METRICS_HOST overrides; "0.0.0.0" for a remote scraper)
+PREWARM_CHATBOT = True # Import the LangChain stack in a background thread on first page load
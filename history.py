@@ -0,0 +1,53 @@
+import sys
+import time
+
+
+class Message:
+    """A single chat message, exactly as shown in the UI and sent to the model.
+
+    Sessions can hold thousands of these, so the record is kept small: __slots__
+    instead of a per-instance dict, roles interned so every message shares one
+    string per role, and the optional fields left as the shared None until used.
+    """
+
+    __slots__ = ("role", "content", "timestamp", "tokens", "display_only")
+
+    def __init__(self, role, content, timestamp=None, tokens=None, display_only=False):
+        self.role = sys.intern(role)
+        self.content = content
+        self.timestamp = timestamp # Seconds since the epoch, if the store records them
+        self.tokens = tokens # Prompt tokens for this message, filled in once counted
+        self.display_only = display_only # Shown in the chat but never sent to the model (e.g. an error notice)
+
+    def __repr__(self):
+        return f"Message(role={self.role!r}, content={self.content!r})"
+
+
+class MessageStore:
+    """Append-only chat history for one session.
+
+    The UI renders from it and the conversation memory builds the prompt history
+    from it, so every message is stored exactly once. Nothing here imports
+    LangChain, so the page can create and render it before the backend loads.
+    """
+
+    def __init__(self, timestamps=False):
+        self.timestamps = timestamps
+        self._messages = []
+
+    def append(self, role, content, display_only=False):
+        message = Message(role, content, time.time() if self.timestamps else None, display_only=display_only)
+        self._messages.append(message)
+        return message
+
+    def clear(self):
+        self._messages.clear()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
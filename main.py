@@ -1,11 +1,32 @@
 import streamlit as st
 import os
+import logging
+import importlib
+import threading
+import time
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import ConversationChain
-from langchain_core.messages import HumanMessage, AIMessage
+from config import (
+    DEFAULT_MODEL,
+    FRAGMENT_TAIL_LIMIT,
+    HISTORY_PAGE_SIZE,
+    METRICS_HOST,
+    METRICS_PORT,
+    MEMORY_BACKEND,
+    MODEL_ROUTING,
+    PREWARM_CHATBOT,
+    METRICS_REFRESH_SECONDS,
+    RECORD_MESSAGE_TIMESTAMPS,
+    ROUTE_MODELS,
+    SHOW_METRICS_PANEL,
+    STREAM_RESPONSES,
+)
+from history import MessageStore
+from metrics import CRISIS_DETECTIONS, REGISTRY, record_turn, start_metrics_server, track_session
+from resilience import CircuitOpen, TurnTimeout
+from safety import detect_crisis
+
+# NOTE: chatbot (and with it LangChain) is imported lazily, on the first message,
+# so the page shell paints without waiting for those imports.
 
 # --- Configuration and API Key ---
 
@@ -20,74 +41,16 @@ if not groq_api_key:
     except KeyError:
         groq_api_key = None # Handle case where key is missing entirely
 
-# --- Constants ---
-DEFAULT_MODEL = "llama3-8b-8192" # Or try "mixtral-8x7b-32768", "llama3-70b-8192"
-
-# --- Prompt Template ---
-# This is CRUCIAL for setting the chatbot's persona and boundaries
-SYSTEM_PROMPT = """
-You are 'Mindful Echo', a supportive and empathetic AI companion designed for mental well-being conversations.
-Your goal is to listen actively, offer encouragement, and provide a safe, non-judgmental space for users to express their feelings.
-
-**Guidelines:**
-*   **Be Kind and Empathetic:** Respond with warmth, understanding, and compassion. Validate the user's feelings.
-*   **Listen Actively:** Pay close attention to what the user shares. Ask clarifying questions gently if needed.
-*   **Be Non-Judgmental:** Create a safe space where the user feels comfortable sharing without fear of criticism.
-*   **Offer General Support & Encouragement:** Provide positive affirmations and gentle encouragement. You can suggest general, widely accepted well-being practices (like mindfulness, deep breathing, taking a walk) if appropriate, but frame them as suggestions, not directives.
-*   **Maintain Neutrality:** Avoid giving personal opinions, specific advice (especially medical, financial, or legal), or making decisions for the user.
-*   **Do Not Diagnose:** You are NOT a therapist or medical professional. Do not attempt to diagnose any condition.
-*   **Prioritize Safety:** If a user expresses thoughts of harming themselves or others, gently guide them towards professional help immediately. Provide contact information for crisis hotlines or emergency services (you can state: "If you are in immediate danger, please contact your local emergency services or a crisis hotline like [mention a relevant hotline, e.g., the National Suicide Prevention Lifeline at 988 in the US].").
-*   **Manage Limitations:** Remind the user that you are an AI and cannot replace professional human support. If the conversation becomes too complex or requires professional expertise, gently suggest seeking help from a qualified therapist, counselor, or doctor.
-*   **Use Conversational History:** Remember previous parts of the conversation to provide relevant and coherent responses.
-
-**Example Interaction Start:**
-User: I've been feeling really down lately.
-Mindful Echo: I'm really sorry to hear you've been feeling down. It sounds tough. I'm here to listen if you'd like to share more about what's been going on. Remember, your feelings are valid.
-
-Remember your core purpose: To be a supportive listener and a beacon of gentle encouragement.
-"""
-
-prompt_template = ChatPromptTemplate.from_messages(
-    [
-        ("system", SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}"),
-    ]
-)
-
-# --- LangChain Initialization Function ---
-# We use a function to initialize to potentially allow model selection later
-def initialize_chain(api_key, model_name=DEFAULT_MODEL):
-    """Initializes the LangChain conversation chain."""
-    if not api_key:
-        st.error("Groq API key is missing. Please set it in .env or Streamlit secrets.")
-        st.stop() # Stop execution if no API key
-
+# Optional pool of extra keys (comma-separated); requests are spread across all keys
+groq_api_keys = os.getenv("GROQ_API_KEYS")
+if not groq_api_keys:
     try:
-        llm = ChatGroq(
-            temperature=0.7, # Adjust for creativity vs. consistency
-            groq_api_key=api_key,
-            model_name=model_name,
-            # max_tokens=1024 # Optional: Limit response length
-        )
-
-        memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True # Important for chat models
-        )
-
-        conversation_chain = ConversationChain(
-            llm=llm,
-            memory=memory,
-            prompt=prompt_template,
-            verbose=False # Set to True for debugging LangChain steps
-        )
-        return conversation_chain
-
-    except Exception as e:
-        st.error(f"Error initializing LangChain: {e}")
-        st.stop()
-
+        groq_api_keys = st.secrets["GROQ_API_KEYS"]
+    except (KeyError, FileNotFoundError):
+        groq_api_keys = ""
+if isinstance(groq_api_keys, str):
+    groq_api_keys = groq_api_keys.split(",")
+groq_api_keys = list(dict.fromkeys(key.strip() for key in [groq_api_key or "", *groq_api_keys] if key.strip()))
 
 # --- Streamlit UI Setup ---
 st.set_page_config(page_title="Mindful Echo - Mental Health Chatbot", layout="wide")
@@ -109,72 +72,276 @@ st.warning(
 # Add a divider
 st.divider()
 
-# --- Session State Initialization ---
-if 'conversation_chain' not in st.session_state:
-    st.session_state.conversation_chain = initialize_chain(groq_api_key)
+# --- Metrics Endpoint ---
+@st.cache_resource(show_spinner=False)
+def metrics_server(port, host):
+    """Starts the Prometheus /metrics endpoint once per process."""
+    try:
+        return start_metrics_server(port, host)
+    except OSError as e:
+        logging.getLogger(__name__).warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+
+metrics_port = int(os.getenv("METRICS_PORT", METRICS_PORT))
+if metrics_port:
+    metrics_server(metrics_port, os.getenv("METRICS_HOST", METRICS_HOST))
+
+# --- Background Prewarm ---
+@st.cache_resource(show_spinner=False)
+def prewarm_chatbot():
+    """Starts importing the chat backend in the background, once per process."""
+    thread = threading.Thread(target=importlib.import_module, args=("chatbot",), daemon=True)
+    thread.start()
+    return thread
+
+if PREWARM_CHATBOT:
+    prewarm_chatbot()
 
+# --- Session State Initialization ---
+# The conversation chain itself is built on the first message (see below)
 if 'messages' not in st.session_state:
-    st.session_state.messages = [] # Store message history {role: "user"/"assistant", content: "message"}
+    # The one copy of the chat history: rendered below and read by the prompt builder
+    st.session_state.messages = MessageStore(timestamps=RECORD_MESSAGE_TIMESTAMPS)
+    track_session(st.session_state.messages)
     # Add initial greeting from assistant if history is empty
     st.session_state.messages.append(
-        {"role": "assistant", "content": "Hello! I'm Mindful Echo. How are you feeling today? I'm here to listen without judgment."}
+        "assistant", "Hello! I'm Mindful Echo. How are you feeling today? I'm here to listen without judgment."
     )
 
+# --- Optional: Add a button to clear chat history ---
+# Handled before the history is drawn, so the cleared chat renders in this same run
+# instead of needing an extra st.rerun()
+if st.sidebar.button("Clear Chat History"):
+    # Empty the history and memory in place; the chain and its LLM client are kept
+    if 'conversation_chain' in st.session_state:
+        from chatbot import reset_conversation
+        reset_conversation(st.session_state.conversation_chain)
+    else:
+        st.session_state.messages.clear()
+    st.session_state.messages.append("assistant", "Chat history cleared. How can I help you now?")
+    st.session_state.visible_messages = HISTORY_PAGE_SIZE
+
 # --- Display Chat History ---
-for message in st.session_state.messages:
-    avatar = "👤" if message["role"] == "user" else "🧠"
-    with st.chat_message(message["role"], avatar=avatar):
-        st.markdown(message["content"])
+def render_message(message):
+    avatar = "👤" if message.role == "user" else "🧠"
+    with st.chat_message(message.role, avatar=avatar):
+        st.markdown(message.content)
+
+def load_earlier_messages():
+    st.session_state.visible_messages += HISTORY_PAGE_SIZE
+
+# Only the most recent messages are sent to the browser; older ones stay in the
+# store until the user pages them in, so each rerun's payload stays bounded.
+if 'visible_messages' not in st.session_state:
+    st.session_state.visible_messages = HISTORY_PAGE_SIZE
+
+first_visible = max(0, len(st.session_state.messages) - st.session_state.visible_messages)
+if first_visible:
+    st.button(f"Load earlier messages ({first_visible} more)", on_click=load_earlier_messages)
+
+# The visible history is drawn once per full script run. Sending a message only
+# reruns the chat fragment below, so this part (and the static page chrome above)
+# isn't repainted on every turn.
+for message in st.session_state.messages[first_visible:]:
+    render_message(message)
+st.session_state.rendered_upto = len(st.session_state.messages)
 
 # --- Handle User Input ---
-user_input = st.chat_input("Share your thoughts or feelings...")
+CRISIS_RESOURCES = """
+*   **Call or text 988** (Suicide & Crisis Lifeline, US), available 24/7
+*   **Text HOME to 741741** (Crisis Text Line, US)
+*   **Call your local emergency number** (911 in the US) if you are in immediate danger
+*   Outside the US, **findahelpline.com** lists free, confidential helplines in your country
+"""
 
-if user_input:
-    # Add user message to session state and display it
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    with st.chat_message("user", avatar="👤"):
-        st.markdown(user_input)
+# Served straight away, without calling the model, while its provider is down
+DEGRADED_MODE_REPLY = f"""
+I'm so sorry, I'm having trouble connecting right now, so I can't give you a proper reply at the moment.
+What you're going through matters, and I'd really like to hear more when I'm back. Please try again in a little while.
+
+If you're struggling right now or thinking about harming yourself, please reach out to someone who can help straight away:
+{CRISIS_RESOURCES}"""
+
+# Shown above the reply when a message contains crisis language (see safety.py)
+CRISIS_BANNER = f"""
+**You don't have to go through this alone.** If you're thinking about harming yourself or someone else,
+please reach out to someone who can help right now:
+{CRISIS_RESOURCES}"""
+
+@st.fragment
+def chat_area():
+    """The live end of the chat: messages since the last full run, plus the input box."""
+    for message in st.session_state.messages[st.session_state.rendered_upto:]:
+        render_message(message)
+
+    user_input = st.chat_input("Share your thoughts or feelings...")
+
+    if user_input:
+        # Add user message to the history and display it
+        st.session_state.messages.append("user", user_input)
+        with st.chat_message("user", avatar="👤"):
+            st.markdown(user_input)
+
+        # Checked locally, before the backend is even loaded, so help is on screen
+        # while the reply is still being generated
+        crisis_categories = detect_crisis(user_input)
+        if crisis_categories:
+            for category in crisis_categories:
+                CRISIS_DETECTIONS.inc(category)
+            st.error(CRISIS_BANNER, icon="🆘")
+
+        # Build the chain on the first message (waits for the prewarm import if it's still running)
+        from chatbot import PromptTooLong, initialize_chain
+        if 'conversation_chain' not in st.session_state:
+            st.session_state.conversation_chain = initialize_chain(groq_api_keys, st.session_state.messages)
+
+        # Get AI response from the conversation pipeline
+        chain = st.session_state.conversation_chain
+
+        try:
+            # Requests share the API's rate limits; say so if this one will have to queue.
+            # This routes the turn and builds its prompt, which stream()/invoke() reuse.
+            expected_wait = chain.expected_wait()
+            if expected_wait >= 1:
+                st.caption(f"⏳ Lots of people are talking with Mindful Echo right now. "
+                           f"Your reply should start in about {expected_wait:.0f} seconds.")
+
+            if STREAM_RESPONSES:
+                # Started before the bubble is drawn, as it fails fast if the provider is down
+                reply_stream = chain.stream()
+
+                # Stream tokens into the assistant bubble as they arrive
+                with st.chat_message("assistant", avatar="🧠"):
+                    ai_response_content = st.write_stream(reply_stream)
+
+                # write_stream returns the full text once the stream is exhausted
+                chain.save_reply(ai_response_content)
+            else:
+                with st.spinner("Mindful Echo is thinking..."):
+                    ai_response_content = chain.invoke() # Also stores the reply
+
+                # Display the AI response
+                render_start = time.perf_counter()
+                with st.chat_message("assistant", avatar="🧠"):
+                    st.markdown(ai_response_content)
+                chain.last_turn.render_time = time.perf_counter() - render_start
+
+        except TurnTimeout:
+            # The request was cancelled and no reply was stored; any partial text
+            # shown above is replaced by this message on the next full run. This and
+            # the other fallback messages below are stored display-only: the store is
+            # also the conversation memory, and the model mustn't see them as its replies.
+            chain.last_turn.error = "TurnTimeout"
+            timeout_message = (
+                "I'm sorry, I'm taking longer than usual to respond right now. "
+                "Please give it a moment and try sending your message again."
+            )
+            st.session_state.messages.append("assistant", timeout_message, display_only=True)
+            with st.chat_message("assistant", avatar="🧠"):
+                st.markdown(timeout_message)
+
+        except PromptTooLong:
+            # Refused before sending, as the provider would have rejected it anyway
+            chain.last_turn.error = "PromptTooLong"
+            too_long_message = (
+                "I'm sorry, that message is too long for me to take in all at once. "
+                "Could you share it in a few shorter messages?"
+            )
+            st.session_state.messages.append("assistant", too_long_message, display_only=True)
+            with st.chat_message("assistant", avatar="🧠"):
+                st.markdown(too_long_message)
+
+        except CircuitOpen:
+            # Too many recent calls failed; answer now instead of waiting on retries and timeouts
+            chain.last_turn.error = "CircuitOpen"
+            st.session_state.messages.append("assistant", DEGRADED_MODE_REPLY, display_only=True)
+            with st.chat_message("assistant", avatar="🧠"):
+                st.markdown(DEGRADED_MODE_REPLY)
+
+        except Exception as e:
+            if chain.last_turn is not None:
+                chain.last_turn.error = type(e).__name__
+            st.error(f"An error occurred: {e}")
+            # Optionally add an error message to the chat
+            error_message = "Sorry, I encountered a problem processing your request. Please try again."
+            st.session_state.messages.append("assistant", error_message, display_only=True)
+            with st.chat_message("assistant", avatar="🧠"):
+                st.markdown(error_message)
+
+        if chain.last_turn is not None:
+            record_turn(chain.last_turn)
+
+    # Drawn by the fragment (which can't write to the sidebar) so it's current after every turn,
+    # including the first one of a session, when the chain is built inside the fragment
+    if MEMORY_BACKEND == "summary" and 'conversation_chain' in st.session_state:
+        tokens_saved = st.session_state.conversation_chain.memory.last_tokens_saved
+        st.caption(f"Conversation summary saved {tokens_saved} tokens on the last turn")
+
+    # Once the fragment is redrawing many messages itself, fold them into the
+    # static history with one full rerun so its per-turn cost stays bounded
+    if len(st.session_state.messages) - st.session_state.rendered_upto >= FRAGMENT_TAIL_LIMIT:
+        st.rerun()
+
+chat_area()
+
+if MODEL_ROUTING:
+    st.sidebar.info(f"Using Models: {ROUTE_MODELS['light']} for quick check-ins, {ROUTE_MODELS['heavy']} for heavier turns")
+else:
+    st.sidebar.info(f"Using Model: {DEFAULT_MODEL}")
+
+# --- Optional: Latency metrics panel ---
+def format_seconds(value):
+    return f"{value * 1000:.1f} ms" if value is not None else "–"
+
+@st.fragment(run_every=METRICS_REFRESH_SECONDS)
+def metrics_panel():
+    """Latency of the last turn and p50/p95 across all sessions in this process."""
+    turns = REGISTRY.recent()
+    if not turns:
+        st.caption("No turns recorded yet.")
+        return
+
+    last = turns[-1]
+    summary = REGISTRY.summary()
+    rows = ["| | last | p50 | p95 |", "|---|---|---|---|"]
+    for name, label in (
+        ("prompt_assembly", "Prompt assembly"),
+        ("network_wait", "Network wait"),
+        ("time_to_first_token", "First token"),
+        ("generation_time", "Generation"),
+        ("render_time", "UI render"),
+        ("retry_wait", "Retry backoff"),
+        ("queue_wait", "Rate-limit queue"),
+    ):
+        stats = summary.get(name, {})
+        rows.append(
+            f"| {label} | {format_seconds(getattr(last, name))} "
+            f"| {format_seconds(stats.get('p50'))} | {format_seconds(stats.get('p95'))} |"
+        )
+    st.markdown("\n".join(rows))
 
-    # Get AI response using the ConversationChain
-    try:
-        with st.spinner("Mindful Echo is thinking..."):
-            # Prepare LangChain input (it expects a dictionary)
-            chain_input = {"input": user_input}
-
-            # Retrieve history from session state for LangChain memory (if needed, though ConversationBufferMemory handles it internally)
-            # chat_history_langchain = []
-            # for msg in st.session_state.messages[:-1]: # Exclude the latest user message
-            #     if msg["role"] == "user":
-            #         chat_history_langchain.append(HumanMessage(content=msg["content"]))
-            #     else:
-            #         chat_history_langchain.append(AIMessage(content=msg["content"]))
-            # chain_input["chat_history"] = chat_history_langchain # Pass history if memory didn't handle it automatically (BufferMemory does)
-
-
-            # Invoke the chain
-            response = st.session_state.conversation_chain.invoke(chain_input)
-            ai_response_content = response.get('response', 'Sorry, I encountered an issue.') # Extract response text
-
-        # Add AI response to session state and display it
-        st.session_state.messages.append({"role": "assistant", "content": ai_response_content})
-        with st.chat_message("assistant", avatar="🧠"):
-            st.markdown(ai_response_content)
-
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
-        # Optionally add an error message to the chat
-        error_message = "Sorry, I encountered a problem processing your request. Please try again."
-        st.session_state.messages.append({"role": "assistant", "content": error_message})
-        with st.chat_message("assistant", avatar="🧠"):
-            st.markdown(error_message)
+    tokens_per_sec = f"{last.tokens_per_sec:.0f} tokens/s" if last.tokens_per_sec else "–"
+    st.caption(
+        f"Last turn: {last.prompt_tokens or '–'} prompt tokens, {last.output_tokens or '–'} output tokens, "
+        f"{tokens_per_sec}. {summary['turns']} turns recorded, {summary['errors']} errors, "
+        f"{summary['retries']} retries, {summary['hedges']} hedges ({summary['hedges_won']} won)."
+    )
 
-# --- Optional: Add a button to clear chat history ---
-if st.sidebar.button("Clear Chat History"):
-    st.session_state.messages = [
-         {"role": "assistant", "content": "Chat history cleared. How can I help you now?"}
-    ]
-    # Re-initialize chain to clear memory (or manage memory clearing explicitly if needed)
-    st.session_state.conversation_chain = initialize_chain(groq_api_key)
-    st.rerun()
-
-st.sidebar.info(f"Using Model: {DEFAULT_MODEL}")
\ No newline at end of file
+    # Per-route latency and cost, for tuning the router's thresholds
+    routes = REGISTRY.route_summary()
+    if routes:
+        rows = ["| Route | turns | first token p50 / p95 | reply p50 / p95 | avg cost |", "|---|---|---|---|---|"]
+        for route, stats in routes.items():
+            first_token = stats.get("time_to_first_token", {})
+            reply = stats.get("generation_time", {})
+            avg_cost = f"${stats['avg_cost'] * 1000:.3f} / 1k turns" if stats["avg_cost"] is not None else "–"
+            rows.append(
+                f"| {route} | {stats['turns']} "
+                f"| {format_seconds(first_token.get('p50'))} / {format_seconds(first_token.get('p95'))} "
+                f"| {format_seconds(reply.get('p50'))} / {format_seconds(reply.get('p95'))} | {avg_cost} |"
+            )
+        st.markdown("\n".join(rows))
+
+with st.sidebar:
+    if st.toggle("Show latency metrics", value=SHOW_METRICS_PANEL):
+        metrics_panel()
@@ -0,0 +1,291 @@
+import logging
+import math
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.prompts import ChatPromptTemplate
+
+# --- Token Counting ---
+
+# Llama 3 uses a tiktoken-style BPE vocabulary, so cl100k_base is a close local
+# approximation. If tiktoken is missing (or its encoding files can't be fetched,
+# e.g. offline) we log a warning and fall back to a padded regex estimate.
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD_TOKENS = 4 # Role header and separators the chat template adds per message
+FALLBACK_TOKEN_MARGIN = 1.2 # The regex estimate is padded by this factor so budgets err on the side of fitting
+
+# Words, numbers and single punctuation marks, roughly how BPE tokenizers split text
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+
+@lru_cache(maxsize=None) # Load each encoding once per process, not once per session
+def _load_encoder(encoding_name):
+    if tiktoken is None:
+        logger.warning("tiktoken is not installed; token counts are regex estimates padded by %s", FALLBACK_TOKEN_MARGIN)
+        return None
+    try:
+        return tiktoken.get_encoding(encoding_name).encode
+    except (OSError, ValueError) as e: # Encoding files are downloaded on first use
+        logger.warning(
+            "Couldn't load the %s encoding (%s); token counts are regex estimates padded by %s",
+            encoding_name, e, FALLBACK_TOKEN_MARGIN,
+        )
+        return None
+
+
+class TokenCounter:
+    """Counts tokens locally, without a round trip to the model provider."""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        self._encode = _load_encoder(encoding_name)
+
+    def count(self, text):
+        if self._encode is not None:
+            return len(self._encode(text))
+        # Long words are usually split into several sub-word tokens (~4 chars each)
+        estimate = sum(1 + (len(piece) - 1) // 4 for piece in _TOKEN_PATTERN.findall(text))
+        return math.ceil(estimate * FALLBACK_TOKEN_MARGIN)
+
+    def count_message(self, message):
+        """Counts a stored history Message or a LangChain message, including overhead."""
+        return self.count(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+    def count_stored(self, message):
+        """Counts a stored history Message once, caching the result on the message.
+
+        Display-only messages never reach the prompt, so they count as 0.
+        """
+        if message.tokens is None:
+            message.tokens = 0 if message.display_only else self.count_message(message)
+        return message.tokens
+
+
+# --- Memory Backends ---
+# Both backends are views over a session's MessageStore (see history.py): they
+# decide which stored messages make up the prompt history, but never copy them.
+# The last stored message is always the user input waiting for a reply.
+# Display-only messages (fallback notices the UI showed instead of a reply) are
+# skipped, so the model never sees them as something it said.
+
+def to_langchain_message(message):
+    if message.role == "user":
+        return HumanMessage(content=message.content)
+    return AIMessage(content=message.content)
+
+
+class TokenWindowMemory:
+    """Prompt history made of the most recent turns that fit within a token budget.
+
+    Each message is counted once (the count is cached on the stored Message), and
+    the window start only ever moves forward as new messages push the running total
+    over max_token_limit. Every turn therefore costs O(new messages) instead of
+    re-counting the whole conversation. The LangChain message for each message in
+    the window is built once too, when it's counted.
+    """
+
+    def __init__(self, store, max_token_limit=2048, token_counter=None):
+        self.store = store
+        self.max_token_limit = max_token_limit
+        self.token_counter = token_counter or TokenCounter()
+        self._counted = 0 # Messages before this store index are included in _total
+        self._start = 0 # Index of the first message in the window
+        self._total = 0 # Tokens in store[_start:]
+        self._window = deque() # (store index, LangChain message, tokens) of each prompt message in the window
+        self.last_counts = [] # Token count of each message the last load_messages() returned
+
+    @property
+    def token_count(self):
+        """Number of tokens currently held in the window."""
+        self._update_window()
+        return self._total
+
+    def _update_window(self):
+        if len(self.store) < self._counted:
+            self.clear() # The store was cleared without telling us
+
+        # Count (and convert) only the messages added since the last call
+        for index, message in enumerate(self.store[self._counted:], self._counted):
+            tokens = self.token_counter.count_stored(message)
+            self._total += tokens
+            if not message.display_only:
+                self._window.append((index, to_langchain_message(message), tokens))
+        self._counted = len(self.store)
+
+        # Move the start forward until we're back under budget, and never start the
+        # window on an assistant reply whose question has been dropped. The newest
+        # message (the pending input) is always kept.
+        last = len(self.store) - 1
+        while self._start < last and (
+            self._total > self.max_token_limit
+            or (self._start and self.store[self._start].role == "assistant")
+        ):
+            self._total -= self.store[self._start].tokens
+            self._start += 1
+        while self._window and self._window[0][0] < self._start:
+            self._window.popleft()
+
+    def load_messages(self):
+        """Returns the prompt history as LangChain messages, ending with the pending input."""
+        self._update_window()
+        self.last_counts = [tokens for _, _, tokens in self._window]
+        return [message for _, message, _ in self._window]
+
+    def after_turn(self):
+        pass # The window is updated lazily on the next load_messages()
+
+    def clear(self):
+        self._counted = 0
+        self._start = 0
+        self._total = 0
+        self._window.clear()
+
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system",
+         "You maintain a running summary of a supportive conversation between a user and "
+         "'Mindful Echo', an empathetic AI companion. Extend the summary with the new lines. "
+         "Keep the user's feelings, the situations they described and anything they asked "
+         "to be remembered. Be concise and write in the third person."),
+        ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{new_lines}\n\nUpdated summary:"),
+    ]
+)
+
+
+class RollingSummaryMemory:
+    """Prompt history that keeps the last few turns verbatim and summarizes the rest.
+
+    Folding older turns into the summary needs an LLM call, so it never happens on
+    the request path: after_turn() (called once the reply is ready) starts a
+    background thread, and the next turn simply uses whatever summary is ready.
+    The call is made with send(messages), which returns the reply text; the
+    Conversation sets it to its complete(), so summaries share the turns' rate
+    limits, API keys, circuit breaker and deadline. Without it nothing is summarized.
+    """
+
+    def __init__(self, store, send=None, recent_turns=3, token_counter=None):
+        self.store = store
+        self.send = send
+        self.recent_turns = recent_turns # Turns (user + assistant message pairs) kept verbatim
+        self.token_counter = token_counter or TokenCounter()
+        self.summary = ""
+        self.last_tokens_saved = 0 # Tokens the summary saved on the most recent prompt
+        self.last_counts = [] # Token count of each message the last load_messages() returned
+        self._summary_tokens = ("", 0) # (summary, its message's token count), counted once per summary
+
+        self._lock = threading.Lock()
+        self._worker = None
+        self._generation = 0 # Bumped by clear() so in-flight summaries are discarded
+        self._summarized = 0 # Messages before this store index are covered by the summary
+        self._folded_tokens = 0 # Tokens of every message folded into the summary
+
+    def load_messages(self):
+        """Returns the prompt history as LangChain messages, ending with the pending input."""
+        if len(self.store) < self._summarized:
+            self.clear() # The store was cleared without telling us
+
+        with self._lock:
+            summary = self.summary
+            start = self._summarized
+            folded_tokens = self._folded_tokens
+
+        recent = [message for message in self.store[start:] if not message.display_only]
+        messages = [to_langchain_message(message) for message in recent]
+        self.last_counts = [self.token_counter.count_stored(message) for message in recent]
+        if not summary:
+            self.last_tokens_saved = 0
+            return messages
+
+        summary_message = SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+        if self._summary_tokens[0] != summary:
+            self._summary_tokens = (summary, self.token_counter.count_message(summary_message))
+        summary_tokens = self._summary_tokens[1]
+        self.last_tokens_saved = folded_tokens - summary_tokens
+        self.last_counts.insert(0, summary_tokens)
+        return [summary_message] + messages
+
+    def after_turn(self):
+        self.summarize_in_background()
+
+    def summarize_in_background(self):
+        """Starts folding turns older than recent_turns into the summary, if any."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return # The next turn picks up whatever this run didn't cover
+
+            end = len(self.store) - 2 * self.recent_turns
+            if end <= self._summarized:
+                return
+
+            self._worker = threading.Thread(
+                target=self._fold,
+                args=(self.store[self._summarized:end], end, self.summary, self._generation),
+                daemon=True,
+            )
+            self._worker.start()
+
+    def _fold(self, old_messages, end, summary, generation):
+        if self.send is None:
+            return
+        new_lines = get_buffer_string(
+            [to_langchain_message(message) for message in old_messages if not message.display_only],
+            ai_prefix="Mindful Echo",
+        )
+        try:
+            new_summary = self.send(
+                SUMMARY_PROMPT.format_messages(summary=summary or "(none yet)", new_lines=new_lines)
+            )
+        except Exception:
+            return # Keep the messages verbatim; the next turn will try again
+
+        folded_tokens = sum(self.token_counter.count_stored(message) for message in old_messages)
+        with self._lock:
+            if generation != self._generation:
+                return # History was cleared while we were summarizing
+            self.summary = new_summary.strip()
+            self._summarized = end
+            self._folded_tokens += folded_tokens
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.last_tokens_saved = 0
+            self._summarized = 0
+            self._folded_tokens = 0
+            self._generation += 1
+
+
+# --- Context Window Fitting ---
+# The memory backends bound the history, but not the whole prompt: a very long
+# input or summary can still overflow a model's context window, which the provider
+# only reports after a wasted round trip. Prompts are measured before sending and
+# trimmed here when they don't fit.
+
+class PromptTooLong(Exception):
+    """The prompt doesn't fit the model's context window, even without any history."""
+
+
+def fit_to_window(messages, counts, limit):
+    """Drops the oldest history from a [system, *history, pending] prompt until it fits in `limit` tokens.
+
+    counts holds each message's token count. The system prompt and the pending
+    input are always kept, and the kept history never starts on an assistant
+    reply. Returns (messages, total tokens); raises PromptTooLong if it can't fit.
+    """
+    total = sum(counts)
+    start, last = 1, len(messages) - 1
+    while start < last and (total > limit or (start > 1 and isinstance(messages[start], AIMessage))):
+        total -= counts[start]
+        start += 1
+    if total > limit:
+        raise PromptTooLong(f"Prompt needs {total} tokens but only {limit} fit")
+    return [messages[0], *messages[start:]], total
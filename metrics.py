@@ -0,0 +1,364 @@
+import bisect
+import threading
+import weakref
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# main.py imports this before the chat backend loads (for the /metrics endpoint and
+# session tracking), so it only uses the standard library.
+
+# --- Per-Turn Metrics ---
+
+TURN_FIELDS = (
+    "prompt_assembly", # Building the prompt from memory
+    "network_wait", # Request sent -> first response chunk (or the full response)
+    "time_to_first_token", # Request sent -> first non-empty text chunk
+    "generation_time", # Request sent -> last chunk, excluding time the UI spent rendering
+    "render_time", # Time spent drawing the reply in the UI
+    "retry_wait", # Backoff slept between retries of a failed call (included in the times above)
+    "queue_wait", # Time queued for the client-side rate limiter (included in network_wait)
+)
+
+
+class TurnMetrics:
+    """Timings (in seconds) and token counts for one conversation turn.
+
+    Fields stay None when they don't apply, e.g. time_to_first_token when the
+    reply wasn't streamed or the call failed.
+    """
+
+    __slots__ = TURN_FIELDS + (
+        "model", "prompt_tokens", "output_tokens", "error", "retries", "hedge", "route", "cost", "context",
+    )
+
+    def __init__(self, model):
+        self.model = model
+        self.prompt_tokens = None
+        self.output_tokens = None
+        self.error = None # Exception type name if the turn failed
+        self.retries = 0 # Calls retried after a transient failure
+        self.hedge = None # "won", "lost" or "failed" if a hedge request was fired
+        self.route = None # Model route the turn was sent to ("light"/"heavy") when routing is on
+        self.cost = None # Estimated provider cost in US$, once token counts are known
+        self.context = None # "upgraded" or "trimmed" if the prompt didn't fit the model's context window
+        for field in TURN_FIELDS:
+            setattr(self, field, None)
+
+    @property
+    def tokens_per_sec(self):
+        """Output speed once tokens started arriving."""
+        if not self.output_tokens or self.generation_time is None:
+            return None
+        streaming_time = self.generation_time - (self.time_to_first_token or 0.0)
+        return self.output_tokens / streaming_time if streaming_time > 0 else None
+
+    def as_dict(self):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values["tokens_per_sec"] = self.tokens_per_sec
+        return values
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class MetricsRegistry:
+    """Process-wide record of the most recent turns across all sessions."""
+
+    def __init__(self, max_turns=1000):
+        self._turns = deque(maxlen=max_turns)
+        self._lock = threading.Lock()
+
+    def record(self, turn):
+        with self._lock:
+            self._turns.append(turn)
+
+    def recent(self, count=None):
+        """Returns the last `count` recorded turns (all kept turns by default), oldest first."""
+        with self._lock:
+            turns = list(self._turns)
+        return turns if count is None else turns[-count:]
+
+    def summary(self):
+        """Returns {metric: {"p50": ..., "p95": ...}} over the kept turns, plus counts."""
+        turns = self.recent()
+        result = {
+            "turns": len(turns),
+            "errors": sum(1 for turn in turns if turn.error),
+            "retries": sum(turn.retries for turn in turns),
+            "hedges": sum(1 for turn in turns if turn.hedge),
+            "hedges_won": sum(1 for turn in turns if turn.hedge == "won"),
+        }
+        for name in TURN_FIELDS + ("prompt_tokens", "output_tokens", "tokens_per_sec"):
+            values = sorted(v for v in (getattr(turn, name) for turn in turns) if v is not None)
+            if values:
+                result[name] = {"p50": _percentile(values, 0.50), "p95": _percentile(values, 0.95)}
+        return result
+
+    def route_summary(self):
+        """Returns {route: {"turns", "errors", "cost", "avg_cost", metric: {"p50", "p95"}}} for routed turns."""
+        by_route = {}
+        for turn in self.recent():
+            if turn.route is not None:
+                by_route.setdefault(turn.route, []).append(turn)
+        result = {}
+        for route, turns in sorted(by_route.items()):
+            costs = [turn.cost for turn in turns if turn.cost is not None]
+            stats = result[route] = {
+                "turns": len(turns),
+                "errors": sum(1 for turn in turns if turn.error),
+                "cost": sum(costs),
+                "avg_cost": sum(costs) / len(costs) if costs else None,
+            }
+            for name in ("time_to_first_token", "generation_time"):
+                values = sorted(v for v in (getattr(turn, name) for turn in turns) if v is not None)
+                if values:
+                    stats[name] = {"p50": _percentile(values, 0.50), "p95": _percentile(values, 0.95)}
+        return result
+
+    def percentile(self, name, fraction, model=None, min_samples=1):
+        """Returns a percentile of one metric over the kept turns (of one model), or None if too few."""
+        values = sorted(
+            value for turn in self.recent() if model is None or turn.model == model
+            for value in (getattr(turn, name),) if value is not None
+        )
+        return _percentile(values, fraction) if len(values) >= min_samples else None
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+
+
+# --- Prometheus Metrics ---
+# Recording happens on every turn from many script threads, so it must not contend
+# on a shared lock. Each thread adds into its own dict ("shard"); the lock is only
+# taken the first time a thread records and when /metrics is scraped.
+
+class _ShardedTotals:
+    """Running totals per key, kept in per-thread dicts and summed on read."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = [] # (weakref to owning thread, shard dict)
+        self._retired = {} # Totals from threads that have exited
+
+    def add(self, key, amount=1):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_finished()
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        shard[key] = shard.get(key, 0) + amount
+
+    def _retire_finished(self):
+        """Folds the shards of finished threads into _retired; call with the lock held.
+
+        Streamlit starts a new thread per script run, so this runs whenever a
+        thread registers a shard (not only on scrapes, which may never happen)
+        to keep the list bounded by the number of live threads.
+        """
+        live = []
+        for thread_ref, shard in self._shards:
+            thread = thread_ref()
+            if thread is None or not thread.is_alive():
+                for key, value in shard.items():
+                    self._retired[key] = self._retired.get(key, 0) + value
+            else:
+                live.append((thread_ref, shard))
+        self._shards = live
+
+    def totals(self):
+        with self._lock:
+            self._retire_finished()
+            totals = dict(self._retired)
+            shards = [shard for _, shard in self._shards]
+
+        for shard in shards:
+            for key, value in list(shard.items()): # Snapshot; the owner may still be writing
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._totals = _ShardedTotals()
+
+    def inc(self, *labels, amount=1):
+        self._totals.add(labels, amount)
+
+    def samples(self):
+        for labels, value in sorted(self._totals.totals().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    """Value that goes up and down; inc and dec may happen on different threads."""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self._totals.add(labels, -amount)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._totals = _ShardedTotals()
+
+    def observe(self, value, *labels):
+        # One key per (labels, bucket) plus sum and count; buckets are made cumulative on read
+        self._totals.add((labels, bisect.bisect_left(self.buckets, value)))
+        self._totals.add((labels, "sum"), value)
+        self._totals.add((labels, "count"))
+
+    def samples(self):
+        totals = self._totals.totals()
+        for labels in sorted({labels for labels, _ in totals}):
+            cumulative = 0
+            for index, bound in enumerate(self.buckets + (float("inf"),)):
+                cumulative += totals.get((labels, index), 0)
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {totals.get((labels, 'sum'), 0)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {totals.get((labels, 'count'), 0)}"
+
+
+TURN_PHASE_SECONDS = Histogram(
+    "mindful_echo_turn_phase_seconds", "Time spent in each phase of a conversation turn.", ("model", "phase"),
+)
+ACTIVE_SESSIONS = Gauge("mindful_echo_active_sessions", "Browser sessions with chat history in memory.")
+LLM_IN_FLIGHT = Gauge("mindful_echo_llm_in_flight", "LLM calls currently waiting on or streaming from the provider.")
+LLM_ERRORS = Counter("mindful_echo_llm_errors_total", "Failed turns, by exception type.", ("model", "exception"))
+TOKENS = Counter("mindful_echo_tokens_total", "Tokens sent and received, by model.", ("model", "kind"))
+LLM_RETRIES = Counter(
+    "mindful_echo_llm_retries_total", "LLM calls retried after a transient failure, by reason.", ("model", "reason"),
+)
+LLM_HEDGES = Counter(
+    "mindful_echo_llm_hedges_total", "Hedge requests fired, by hedge model and outcome (won/lost/failed).",
+    ("model", "outcome"),
+)
+API_KEY_EVICTIONS = Counter(
+    "mindful_echo_api_key_evictions_total", "API keys set aside after auth or quota errors, by status code.",
+    ("status",),
+)
+CIRCUIT_OPEN = Gauge("mindful_echo_circuit_open", "1 while a model's circuit breaker is open or half-open.", ("model",))
+BACKEND_HEALTHY = Gauge("mindful_echo_backend_healthy", "1 while a backend passes its health check.", ("backend",))
+LLM_FAILOVERS = Counter(
+    "mindful_echo_llm_failovers_total", "Turns moved from one model backend to the next.", ("from_model", "to_model"),
+)
+ROUTED_TURNS = Counter(
+    "mindful_echo_routed_turns_total", "Turns sent to each model route, by the signal that chose it.",
+    ("route", "reason"),
+)
+ROUTE_REPLY_SECONDS = Histogram(
+    "mindful_echo_route_reply_seconds", "Request sent -> reply finished, by model route.", ("route",),
+)
+LLM_COST = Counter(
+    "mindful_echo_llm_cost_dollars_total", "Estimated provider cost of turns in US$, by model route and model.",
+    ("route", "model"),
+)
+CONTEXT_FITS = Counter(
+    "mindful_echo_context_fits_total",
+    "Prompts too long for their model's context window, by model and action (upgraded/trimmed/too_long).",
+    ("model", "action"),
+)
+CRISIS_DETECTIONS = Counter(
+    "mindful_echo_crisis_detections_total", "User messages matching crisis language, by category.", ("category",),
+)
+
+PROMETHEUS_METRICS = [
+    TURN_PHASE_SECONDS, ACTIVE_SESSIONS, LLM_IN_FLIGHT, LLM_ERRORS, TOKENS, LLM_RETRIES, LLM_HEDGES, API_KEY_EVICTIONS,
+    CIRCUIT_OPEN, BACKEND_HEALTHY, LLM_FAILOVERS, ROUTED_TURNS, ROUTE_REPLY_SECONDS, LLM_COST,
+    CONTEXT_FITS, CRISIS_DETECTIONS,
+]
+
+
+def render_prometheus():
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in PROMETHEUS_METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes every few seconds would flood the app's logs
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics on a daemon thread in this process and returns the server.
+
+    Only reachable from this machine by default; pass host="0.0.0.0" for a scraper elsewhere.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+# --- Recording API ---
+
+REGISTRY = MetricsRegistry()
+
+
+def record_turn(turn):
+    """Records a finished (or failed) turn for the in-process API and for Prometheus."""
+    REGISTRY.record(turn)
+    for phase in TURN_FIELDS:
+        value = getattr(turn, phase)
+        if value is not None:
+            TURN_PHASE_SECONDS.observe(value, turn.model, phase)
+    if turn.prompt_tokens:
+        TOKENS.inc(turn.model, "prompt", amount=turn.prompt_tokens)
+    if turn.output_tokens:
+        TOKENS.inc(turn.model, "output", amount=turn.output_tokens)
+    if turn.error:
+        LLM_ERRORS.inc(turn.model, turn.error)
+    if turn.route is not None and turn.generation_time is not None:
+        ROUTE_REPLY_SECONDS.observe(turn.generation_time, turn.route)
+    if turn.cost:
+        LLM_COST.inc(turn.route or "none", turn.model, amount=turn.cost)
+
+
+def track_session(store):
+    """Counts a session as active until its message store is garbage collected."""
+    ACTIVE_SESSIONS.inc()
+    weakref.finalize(store, ACTIVE_SESSIONS.dec)
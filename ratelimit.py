@@ -0,0 +1,211 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+# --- Client-Side Rate Limiting ---
+# Groq enforces requests-per-minute and tokens-per-minute quotas per API key and
+# model. Rather than every session sending as fast as it can and collecting 429s,
+# requests wait here until both quotas have room. Waiting happens on the shared
+# LLM event loop (see resilience), so a queued request holds no thread.
+
+class TokenBucket:
+    """Quota that refills continuously at `rate` per second, up to `capacity`.
+
+    Not thread-safe on its own; RequestScheduler guards its buckets with a lock.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount, now):
+        """Seconds until `amount` is available (requests bigger than the bucket only need it full)."""
+        self.refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount, now):
+        self.refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """RPM/TPM quotas for one API key and model, shared fairly by all sessions.
+
+    Each session has its own FIFO of waiting requests and sessions are served in
+    rotation, so one busy session can't starve the others. A request's token cost
+    is an estimate made before sending; settle() corrects it once usage is known.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self._lock = threading.Lock() # acquire() runs on the event loop; the UI reads waits from script threads
+        self._queues = OrderedDict() # session -> deque of (tokens, future), in rotation order
+        self._queued_requests = 0
+        self._queued_tokens = 0
+        self._hold_until = 0.0 # Set when the provider says to back off (429 with Retry-After)
+        self._timer = None # Pending wake-up; only touched on the event loop
+
+    async def acquire(self, session, tokens):
+        """Waits until a request costing `tokens` may be sent and returns the seconds waited."""
+        start = time.monotonic()
+        entry = (tokens, asyncio.get_running_loop().create_future())
+        with self._lock:
+            self._queues.setdefault(session, deque()).append(entry)
+            self._queued_requests += 1
+            self._queued_tokens += tokens
+        self._dispatch()
+        try:
+            await entry[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                queue = self._queues.get(session)
+                if queue and entry in queue:
+                    self._remove(session, queue, entry)
+                elif not entry[1].cancelled(): # Granted just before the cancel: give the quota back
+                    self.requests.level = min(self.requests.capacity, self.requests.level + 1)
+                    self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+            raise
+        return time.monotonic() - start
+
+    def _remove(self, session, queue, entry):
+        queue.remove(entry)
+        self._queued_requests -= 1
+        self._queued_tokens -= entry[0]
+        if not queue:
+            del self._queues[session]
+
+    def _dispatch(self):
+        """Grants waiting requests in rotation while the quotas allow; runs on the event loop."""
+        with self._lock:
+            now = time.monotonic()
+            while self._queues:
+                session, queue = next(iter(self._queues.items()))
+                entry = queue[0]
+                tokens, future = entry
+                if not future.cancelled():
+                    wait = max(
+                        self._hold_until - now,
+                        self.requests.time_until(1, now),
+                        self.tokens.time_until(tokens, now),
+                    )
+                    if wait > 0:
+                        self._wake_in(wait)
+                        return
+                    self.requests.take(1, now)
+                    self.tokens.take(tokens, now)
+                    future.set_result(None)
+                self._remove(session, queue, entry)
+                if session in self._queues:
+                    self._queues.move_to_end(session) # Next session's turn
+
+    def _wake_in(self, seconds):
+        loop = asyncio.get_running_loop()
+        if self._timer is not None and self._timer.when() <= loop.time() + seconds:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(seconds, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def hold(self, seconds):
+        """Sends nothing for `seconds`, e.g. after the provider returned a 429."""
+        with self._lock:
+            self._hold_until = max(self._hold_until, time.monotonic() + seconds)
+
+    def settle(self, reserved, used):
+        """Corrects the token quota once a request's real usage is known."""
+        with self._lock:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - used)
+
+    def headroom(self):
+        """Fraction of the tighter quota left after queued requests (negative once requests must wait)."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return min(
+                (self.requests.level - self._queued_requests) / self.requests.capacity,
+                (self.tokens.level - self._queued_tokens) / self.tokens.capacity,
+            )
+
+    def expected_wait(self, tokens):
+        """Roughly how long a request costing `tokens` would wait if queued now, in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            request_wait = (self._queued_requests + 1 - self.requests.level) / self.requests.rate
+            token_wait = (
+                self._queued_tokens + min(tokens, self.tokens.capacity) - self.tokens.level
+            ) / self.tokens.rate
+            return max(0.0, self._hold_until - now, request_wait, token_wait)
+
+
+# --- API Key Pool ---
+# Every key has its own quotas (its own schedulers). A request goes to the key
+# with the most headroom, and keys that fail with auth or quota errors are set
+# aside for a while so requests stop landing on them.
+
+class KeyUnavailable(Exception):
+    """A request failed because of its API key, which was evicted; retry it on another key."""
+
+
+class KeyPool:
+    """Which of a set of API keys are usable right now, shared by every session."""
+
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self._lock = threading.Lock()
+        # key (for every model) or (key, model) -> time.monotonic() it may be used again
+        self._evicted_until = {}
+        self._turn = 0 # Rotates ties between equally idle keys
+
+    def evict(self, key, seconds, model=None):
+        """Takes key out of use for seconds: for one model (e.g. its quota ran out), or for all of them."""
+        entry = key if model is None else (key, model)
+        with self._lock:
+            self._evicted_until[entry] = max(self._evicted_until.get(entry, 0.0), time.monotonic() + seconds)
+
+    def _due_back(self, key, model):
+        return max(self._evicted_until.get(key, 0.0), self._evicted_until.get((key, model), 0.0))
+
+    def available(self, model=None):
+        """Keys not currently evicted (for model, if given)."""
+        now = time.monotonic()
+        with self._lock:
+            return [key for key in self.keys if self._due_back(key, model) <= now]
+
+    def pick(self, routes, model=None):
+        """Returns the (key, client, scheduler) route for model whose key has the most headroom.
+
+        If every key is evicted, the one due back soonest is used rather than failing outright.
+        """
+        return self._choose(routes, model, rotate=True)
+
+    def peek(self, routes, model=None):
+        """Returns the route pick() would choose now, without moving the rotation on."""
+        return self._choose(routes, model, rotate=False)
+
+    def _choose(self, routes, model, rotate):
+        available = set(self.available(model))
+        healthy = [route for route in routes if route[0] in available]
+        if not healthy:
+            with self._lock:
+                return min(routes, key=lambda route: self._due_back(route[0], model))
+        with self._lock:
+            start = self._turn % len(healthy)
+            if rotate:
+                self._turn += 1
+        healthy = healthy[start:] + healthy[:start]
+        return max(healthy, key=lambda route: route[2].headroom() if route[2] is not None else 1.0)
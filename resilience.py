@@ -0,0 +1,390 @@
+import asyncio
+import concurrent.futures
+import queue
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+# --- Async LLM Calls With a Deadline ---
+# Streamlit runs each script on its own thread, so a blocking LLM call pins that
+# thread with no way to interrupt it. Instead, calls run as tasks on one shared
+# event loop; the script thread waits on them with a deadline and cancels the task
+# if it passes. Cancelling the task aborts the underlying HTTP request and
+# releases its connection straight away.
+
+class TurnTimeout(Exception):
+    """The LLM didn't finish its reply within the turn deadline."""
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Returns the process-wide event loop for LLM calls, starting it on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+
+def run_with_deadline(make_coroutine, timeout):
+    """Runs make_coroutine() on the shared loop and returns its result.
+
+    Raises TurnTimeout (after cancelling the call) if it takes longer than timeout seconds.
+    """
+    future = asyncio.run_coroutine_threadsafe(make_coroutine(), get_event_loop())
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError: # Only an alias of the builtin TimeoutError from Python 3.11
+        raise TurnTimeout(f"No reply within {timeout:g}s") from None
+    finally:
+        future.cancel() # No-op if it already finished
+
+
+_DONE = object()
+
+
+def stream_with_deadline(make_stream, timeout):
+    """Iterates the async iterator make_stream() on the shared loop, yielding its items here.
+
+    The whole stream must finish within timeout seconds, otherwise the call is
+    cancelled and TurnTimeout is raised. Closing this generator early (the caller
+    stopped reading) cancels the call too.
+    """
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in make_stream():
+                items.put(item)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            items.put(e)
+        else:
+            items.put(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_event_loop())
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                item = items.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TurnTimeout(f"Reply not finished within {timeout:g}s") from None
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel() # No-op if it already finished
+
+
+# --- Retries ---
+# Transient failures (429s, 5xx, dropped connections) are retried on the event
+# loop with exponential backoff and full jitter, so sessions that failed together
+# don't all retry together. A Retry-After from the provider replaces the computed
+# delay. Retrying stops once the next wait would overrun the policy's time budget.
+
+def retry_after_seconds(error):
+    """Seconds the provider asked us to wait (Retry-After / retry-after-ms), if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """How often and how long to retry a failed LLM call."""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, budget=15.0, retryable=None, rerouted=None):
+        self.max_attempts = max_attempts # Tries per call, including the first
+        self.base_delay = base_delay # Backoff cap before the first retry; doubles per retry
+        self.max_delay = max_delay
+        self.budget = budget # Seconds from the first try after which no retry starts
+        self.retryable = retryable or (lambda error: True)
+        # Errors that send the call somewhere else (e.g. another API key): retried
+        # straight away, without using up an attempt
+        self.rerouted = rerouted or (lambda error: False)
+
+    def next_delay(self, attempt, error, elapsed):
+        """Seconds to wait before retrying after failed try number `attempt`, or None to give up."""
+        if self.rerouted(error):
+            return 0.0 if elapsed <= self.budget else None
+        if attempt >= self.max_attempts or not self.retryable(error):
+            return None
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.base_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return delay if elapsed + delay <= self.budget else None
+
+
+async def retry_call(make_coroutine, policy, on_retry=None):
+    """Awaits make_coroutine(), retrying per policy. on_retry(error, delay) runs before each wait."""
+    start = time.monotonic()
+    attempt = 1
+    while True:
+        try:
+            return await make_coroutine()
+        except Exception as e:
+            delay = policy.next_delay(attempt, e, time.monotonic() - start)
+            if delay is None:
+                raise
+            if not policy.rerouted(e):
+                attempt += 1
+            if on_retry:
+                on_retry(e, delay)
+            await asyncio.sleep(delay)
+
+
+async def retry_stream(make_stream, policy, on_retry=None):
+    """Iterates make_stream(), retrying per policy if it fails before yielding anything.
+
+    Once an item has been passed on (and possibly shown to the user) a failure is
+    raised as-is, since starting over would repeat that text.
+    """
+    start = time.monotonic()
+    attempt = 1
+    while True:
+        started = False
+        try:
+            async for item in make_stream():
+                started = True
+                yield item
+            return
+        except Exception as e:
+            delay = None if started else policy.next_delay(attempt, e, time.monotonic() - start)
+            if delay is None:
+                raise
+            if not policy.rerouted(e):
+                attempt += 1
+            if on_retry:
+                on_retry(e, delay)
+            await asyncio.sleep(delay)
+
+
+# --- Failover ---
+# Sources (backends) are tried in order; a failure moves on to the next one only
+# if should_failover accepts the error, e.g. an outage rather than a bad request.
+
+async def failover_call(make_calls, should_failover, on_failover=None):
+    """Awaits each of make_calls in turn until one succeeds. on_failover(index, error) runs before moving on."""
+    for index, make_call in enumerate(make_calls):
+        try:
+            return await make_call()
+        except Exception as e:
+            if index == len(make_calls) - 1 or not should_failover(e):
+                raise
+            if on_failover:
+                on_failover(index + 1, e)
+
+
+async def failover_stream(make_streams, should_failover, on_failover=None):
+    """Iterates each of make_streams in turn until one completes; as failover_call.
+
+    A source that fails after yielding something isn't replaced, as its text may
+    already be on screen.
+    """
+    for index, make_stream in enumerate(make_streams):
+        started = False
+        try:
+            async for item in make_stream():
+                started = True
+                yield item
+            return
+        except Exception as e:
+            if started or index == len(make_streams) - 1 or not should_failover(e):
+                raise
+            if on_failover:
+                on_failover(index + 1, e)
+
+
+# --- Hedged Requests ---
+# If the primary call is slower to start than usual, the same request is sent to
+# a second model and whichever starts answering first is used. The other call is
+# cancelled, so a hedge costs at most one extra partial request.
+
+class _Contender:
+    """One side of a hedged stream, buffering its items until the race is decided."""
+
+    def __init__(self, make_stream, has_started, ready):
+        self.items = asyncio.Queue()
+        self.error = None
+        self._ready = ready # Shared queue this contender puts itself on once it's started or finished
+        self._is_ready = False
+        self.task = asyncio.ensure_future(self._run(make_stream, has_started))
+
+    def _set_ready(self):
+        if not self._is_ready:
+            self._is_ready = True
+            self._ready.put_nowait(self)
+
+    async def _run(self, make_stream, has_started):
+        try:
+            async for item in make_stream():
+                self.items.put_nowait(item)
+                if has_started(item):
+                    self._set_ready()
+            self.items.put_nowait(_DONE)
+        except Exception as e:
+            self.error = e
+            self.items.put_nowait(e)
+        self._set_ready()
+
+
+async def hedged_stream(make_primary, make_hedge, hedge_after, has_started=None, on_hedge=None):
+    """Iterates make_primary(), racing make_hedge() against it if it hasn't started after hedge_after seconds.
+
+    has_started(item) tells whether an item counts as the reply starting (by
+    default any item does). If a hedge is fired, on_hedge(outcome) is called once
+    the race is decided: "won" (the hedge answered first), "lost" or "failed"
+    (both calls failed; the primary's error is raised).
+    """
+    has_started = has_started or (lambda item: True)
+    ready = asyncio.Queue()
+    primary = _Contender(make_primary, has_started, ready)
+    contenders = [primary]
+    try:
+        try:
+            winner = await asyncio.wait_for(ready.get(), hedge_after)
+        except asyncio.TimeoutError: # Only an alias of the builtin TimeoutError from Python 3.11
+            contenders.append(_Contender(make_hedge, has_started, ready))
+            for _ in contenders:
+                winner = await ready.get()
+                if winner.error is None:
+                    break
+            else:
+                winner = primary
+            if on_hedge:
+                on_hedge("failed" if winner.error else "won" if winner is not primary else "lost")
+
+        for contender in contenders:
+            if contender is not winner:
+                contender.task.cancel()
+        while True:
+            item = await winner.items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        for contender in contenders:
+            contender.task.cancel() # No-op for finished ones
+
+
+async def hedged_call(make_primary, make_hedge, hedge_after, on_hedge=None):
+    """Awaits make_primary(), racing make_hedge() against it if it isn't done after hedge_after seconds.
+
+    on_hedge(outcome) is called as for hedged_stream.
+    """
+    primary = asyncio.ensure_future(make_primary())
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        hedge = asyncio.ensure_future(make_hedge())
+        tasks.append(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if on_hedge:
+                        on_hedge("won" if task is hedge else "lost")
+                    return task.result()
+        if on_hedge:
+            on_hedge("failed")
+        return primary.result() # Raises the primary's error
+    finally:
+        for task in tasks:
+            task.cancel() # No-op for finished ones
+
+
+# --- Circuit Breaker ---
+# During a provider incident, every turn would otherwise wait out its retries and
+# deadline before failing. The breaker watches recent calls to one model and, once
+# too many fail or are slow, refuses calls outright so the UI can answer at once.
+# While open it probes the provider in the background and closes on the first
+# success; user turns are never used as probes.
+
+class CircuitOpen(Exception):
+    """The provider is unhealthy; the call was refused without being sent."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open health gate for one model, shared by all sessions."""
+
+    def __init__(self, probe, window=20, min_calls=10, failure_ratio=0.5, slow_call_seconds=10.0,
+                 probe_interval=15.0, on_state_change=None):
+        self.probe = probe # Coroutine factory for a cheap request; succeeding closes the circuit
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio # Share of the window that must fail to open the circuit
+        self.slow_call_seconds = slow_call_seconds # Calls slower than this count as failures
+        self.probe_interval = probe_interval
+        self.on_state_change = on_state_change # on_state_change(old, new)
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window) # True for each failed call
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raises CircuitOpen unless calls may be sent."""
+        if self.state != "closed":
+            raise CircuitOpen("The model provider is unavailable right now")
+
+    def record_success(self, elapsed):
+        """Records a call that answered after `elapsed` seconds (slow answers count as failures)."""
+        self._record(elapsed >= self.slow_call_seconds)
+
+    def record_failure(self):
+        self._record(True)
+
+    def _record(self, failed):
+        with self._lock:
+            if self.state != "closed":
+                return # Late results from calls sent before the circuit opened
+            self._outcomes.append(failed)
+            if len(self._outcomes) < self.min_calls or sum(self._outcomes) < self.failure_ratio * len(self._outcomes):
+                return
+            self._outcomes.clear()
+            self._set_state("open")
+        asyncio.run_coroutine_threadsafe(self._probe_until_healthy(), get_event_loop())
+
+    def _set_state(self, state):
+        old, self.state = self.state, state
+        if self.on_state_change and old != state:
+            self.on_state_change(old, state)
+
+    async def _probe_until_healthy(self):
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            self._set_state("half_open")
+            try:
+                await asyncio.wait_for(self.probe(), self.slow_call_seconds)
+            except Exception:
+                self._set_state("open")
+                continue
+            with self._lock:
+                self._set_state("closed")
+            return
@@ -0,0 +1,73 @@
+import re
+
+from safety import detect_crisis
+
+# --- Turn Routing ---
+# Each turn goes to a model picked from cheap local signals: how long the message
+# is, how deep the conversation has got, and how emotionally intense it reads.
+# Quick check-ins go to a small, fast model; long, deep or heavy turns, and any
+# turn that mentions risk of harm, go to a larger one.
+
+WORD_PATTERN = re.compile(r"[a-z']+")
+
+# Words that mark a strongly emotional message; each one found adds to the score
+INTENSE_WORDS = frozenset((
+    "abandoned", "alone", "anxious", "ashamed", "awful", "broken", "crying", "depressed", "desperate",
+    "devastated", "empty", "exhausted", "furious", "grief", "grieving", "guilty", "hate", "helpless",
+    "hopeless", "hurt", "hurting", "lonely", "lost", "miserable", "numb", "overwhelmed", "panic",
+    "panicking", "scared", "shaking", "terrified", "trapped", "unbearable", "useless", "worthless",
+))
+
+
+class RouteDecision:
+    """Which route (and model) a turn was sent to, and why."""
+
+    __slots__ = ("route", "model", "score", "reason")
+
+    def __init__(self, route, model, score, reason):
+        self.route = route
+        self.model = model
+        self.score = score
+        self.reason = reason # "risk", "length", "depth" or "intensity" for heavy turns, "default" otherwise
+
+    def __repr__(self):
+        return f"RouteDecision({self.route!r}, {self.model!r}, score={self.score:.2f}, reason={self.reason!r})"
+
+
+class ComplexityRouter:
+    """Scores a turn's message and picks the "light" or "heavy" model for it.
+
+    score = length + depth + intensity, where a message of long_message_words
+    counts 1.0 toward length, a conversation of deep_conversation_turns counts 0.5
+    toward depth and each intense word 0.5 toward intensity (capped at 1.0).
+    Turns scoring heavy_score or more, or mentioning risk of harm, go heavy.
+    """
+
+    def __init__(self, models, long_message_words=60, deep_conversation_turns=10, heavy_score=1.0):
+        self.models = models # Route name ("light", "heavy") -> model name
+        self.long_message_words = long_message_words
+        self.deep_conversation_turns = deep_conversation_turns
+        self.heavy_score = heavy_score
+
+    def signals(self, text, depth):
+        """Returns each signal's contribution to the score for this message, `depth` turns in."""
+        words = WORD_PATTERN.findall(text.lower())
+        return {
+            "risk": bool(detect_crisis(text)), # Any crisis language (see safety.py) sends the turn heavy
+            "length": min(len(words) / self.long_message_words, 1.0),
+            "depth": 0.5 * min(depth / self.deep_conversation_turns, 1.0),
+            "intensity": min(0.5 * sum(word in INTENSE_WORDS for word in words), 1.0),
+        }
+
+    def route(self, text, depth):
+        """Picks the route for a message sent `depth` turns into the conversation."""
+        signals = self.signals(text, depth)
+        risk = signals.pop("risk")
+        score = sum(signals.values())
+        if risk:
+            route, reason = "heavy", "risk"
+        elif score >= self.heavy_score:
+            route, reason = "heavy", max(signals, key=signals.get)
+        else:
+            route, reason = "light", "default"
+        return RouteDecision(route, self.models[route], score, reason)
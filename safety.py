@@ -0,0 +1,178 @@
+import re
+from functools import lru_cache
+from itertools import islice
+
+# main.py runs the check before it imports the chat backend, so this module only
+# uses the standard library.
+
+# --- Crisis Language Detection ---
+# Every user message is checked locally for self-harm and harm-to-others language,
+# so crisis resources can be shown straight away instead of after a model round
+# trip. All phrases are compiled into one Aho-Corasick automaton over words
+# (flattened into a DFA), which reads a message once, one word at a time, however
+# many phrases there are.
+#
+# Messages and phrases go through the same normalization: lower case, apostrophes
+# dropped, common digit/symbol substitutions undone (k1ll -> kill), anything else
+# that isn't a letter treated as a word break, and repeated letters collapsed
+# (killll, kill -> kil). A trailing "*" on a phrase's last word matches any word
+# ending there (suicid* -> suicide, suicidal); stems only apply at that position,
+# in the automaton states that can take them, so "self harm*" would never touch
+# "harmonica" anywhere else. Stems that are also the start of everyday words
+# (harm -> harmony) are spelled out instead. Misspellings that normalization
+# can't undo are listed as their own phrases. Collapsing letters merges some
+# words ("off" and "of", "shoot" and "shot"), so phrases are chosen not to
+# collide with everyday text once normalized. Each (state, word) step goes
+# through a cache, as messages keep reusing the same everyday vocabulary.
+
+_APOSTROPHES = str.maketrans({"'": None, "’": None})
+_SUBSTITUTIONS = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"})
+_WORDS = re.compile(r"[a-z]+")
+_REPEATS = re.compile(r"(.)\1+")
+_NUMBER_BEFORE = re.compile(r"\d[\d.,]*\s*$") # A number right before a word ("5 kms")
+
+
+def _split(text):
+    return _WORDS.findall(text.lower().translate(_APOSTROPHES).translate(_SUBSTITUTIONS))
+
+
+# Placeholders expanded into each of their spellings
+_VARIANTS = {
+    "{self}": ("myself", "my self", "meself", "mself"),
+    "{want}": ("want to", "wanna"),
+}
+
+CRISIS_PHRASES = {
+    "self_harm": (
+        "suicid*", "sucid*", "suicd*", "suiced*", "suisid*", "suisd*", "sueside*", "sewerslide", "unaliv*", "kms",
+        "kill {self}", "killing {self}", "end {self}", "hang {self}", "hurt {self}", "hurting {self}",
+        "harm {self}", "harming {self}", "cut {self}", "cutting {self}", "starve {self}",
+        "self harm", "self harming", "self harmed", "selfharm", "selfharming", "selfharmed",
+        "end my life", "ending my life", "take my own life", "take my life", "end it all", "ending it all",
+        "{want} die", "{want} be dead", "wish i was dead", "wish i were dead", "better off dead",
+        "better off without me", "no reason to live", "nothing to live for", "dont want to live",
+        "dont want to be alive", "dont want to be here anymore", "dont want to wake up", "never wake up again",
+        "not worth living", "overdos*", "slit my wrist", "slit my wrists", "jump off a bridge",
+    ),
+    "harm_to_others": (
+        "kill him", "kill her", "kill them", "kill someone", "kill somebody", "kill everyone", "kill people",
+        "murder him", "murder her", "murder them", "murder someone", "{want} murder",
+        "hurt someone", "hurt somebody", "hurt people", "hurt others", "harm someone", "harm others",
+        "stab him", "stab her", "stab them", "stab someone", "bring a gun to",
+    ),
+}
+
+# Phrases that are also an everyday unit after a number ("I ran 5 kms today"): not a match there
+NOT_AFTER_NUMBER = frozenset(("kms",))
+
+
+def _expand(phrase):
+    for placeholder, spellings in _VARIANTS.items():
+        if placeholder in phrase:
+            return [variant for spelling in spellings for variant in _expand(phrase.replace(placeholder, spelling))]
+    return [phrase]
+
+
+class CrisisDetector:
+    """Finds crisis phrases in a message in one pass over its normalized words."""
+
+    def __init__(self, phrases):
+        # Trie of the phrases' words: state -> {word: next state}, with stems keyed as "stem*"
+        goto = [{}]
+        depth = [0]
+        accepts = {} # State -> ((category, phrase), ...) that end there
+        for category, category_phrases in phrases.items():
+            for phrase in category_phrases:
+                for variant in _expand(phrase):
+                    words = [_REPEATS.sub(r"\1", word) for word in _split(variant.rstrip("*"))]
+                    if variant.endswith("*"):
+                        words[-1] += "*"
+                    state = 0
+                    for word in words:
+                        if word not in goto[state]:
+                            goto.append({})
+                            depth.append(depth[state] + 1)
+                            goto[state][word] = len(goto) - 1
+                        state = goto[state][word]
+                    accepts[state] = accepts.get(state, ()) + ((category, phrase),)
+        self._depth = depth
+
+        # Fold the failure links into the transitions (breadth first, so every
+        # state's fallback is complete before its children need it). Transitions
+        # back to the root are left out; a missing key means state 0.
+        self._delta = [dict(goto[0])] + [{} for _ in goto[1:]]
+        self._stems = [self._compile_stems(self._delta[0])] + [None] * (len(goto) - 1)
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            fallback = fail[state]
+            delta = self._delta[state]
+            delta.update(self._delta[fallback])
+            for word, child in goto[state].items():
+                if word.endswith("*"):
+                    fail[child] = self._delta[fallback].get(word, 0)
+                else:
+                    fail[child] = self._next(fallback, word)
+                delta[word] = child
+                queue.append(child)
+            self._stems[state] = self._compile_stems(delta)
+            if fail[state] in accepts:
+                accepts[state] = accepts.get(state, ()) + accepts[fail[state]]
+        self._accepts = accepts
+        self._guarded = {state for state, matches in accepts.items() if any(p in NOT_AFTER_NUMBER for _, p in matches)}
+        self._step = lru_cache(maxsize=65536)(self._step)
+
+    @staticmethod
+    def _compile_stems(delta):
+        stems = sorted((word[:-1] for word in delta if word.endswith("*")), key=len, reverse=True)
+        return re.compile("|".join(stems)) if stems else None
+
+    def _next(self, state, word):
+        """The state after reading a normalized word in state: the deepest of its exact and stem transitions."""
+        delta = self._delta[state]
+        target = delta.get(word, 0)
+        stems = self._stems[state]
+        stem = stems.match(word) if stems is not None else None
+        if stem:
+            by_stem = delta[stem.group() + "*"]
+            if self._depth[by_stem] > self._depth[target]:
+                target = by_stem
+        return target
+
+    def _step(self, state, word):
+        return self._next(state, _REPEATS.sub(r"\1", word))
+
+    def normalize(self, text):
+        """Returns the words of text in the detector's normalized form (stems aren't applied)."""
+        return [_REPEATS.sub(r"\1", word) for word in _split(text)]
+
+    def scan(self, text):
+        """Returns the (category, phrase) pairs found in text, in order of where they end."""
+        step, accepts = self._step, self._accepts
+        text = text.lower().translate(_APOSTROPHES)
+        words = _WORDS.findall(text.translate(_SUBSTITUTIONS))
+        state = 0
+        found = []
+        for index, word in enumerate(words):
+            state = step(state, word)
+            if state in accepts:
+                matches = accepts[state]
+                if state in self._guarded and self._after_number(text, index):
+                    matches = [match for match in matches if match[1] not in NOT_AFTER_NUMBER]
+                found.extend(matches)
+        return found
+
+    @staticmethod
+    def _after_number(text, index):
+        """Whether the index-th word of text (before substitutions) comes right after a number."""
+        # Rare (only for NOT_AFTER_NUMBER phrases), so positions are only worked out here
+        start = next(islice(_WORDS.finditer(text.translate(_SUBSTITUTIONS)), index, None)).start()
+        return _NUMBER_BEFORE.search(text, max(start - 32, 0), start) is not None
+
+
+_DETECTOR = CrisisDetector(CRISIS_PHRASES)
+
+
+def detect_crisis(text):
+    """Returns the crisis categories ("self_harm", "harm_to_others") text matches, in order; empty if none."""
+    return list(dict.fromkeys(category for category, _ in _DETECTOR.scan(text)))